@@ -1,8 +1,25 @@
 # Imports
 from string_arrows import *
+from pvector import PVector
+from bisect import bisect_right
+from collections import OrderedDict
+    
+import hashlib
+    
+import operator
+    
+import os
+    
+import pickle
+    
+import re
     
 import string
     
+import threading
+    
+import time
+    
 # constants
 DIGITS = '0123456789'
 LETTERS = string.ascii_letters
@@ -63,6 +80,8 @@ class RunTimeError(Error):
 #positibn
 # keeps position of index, line, column etc...
 class Position:
+    __slots__ = ('idx', 'ln', 'col', 'fn', 'ftxt')
+
     def __init__(self, idx, ln, col, fn, ftxt):
         self.idx = idx
         self.ln = ln
@@ -84,6 +103,55 @@ class Position:
     def copy(self):
         return Position(self.idx, self.ln, self.col, self.fn, self.ftxt)
 
+# one source text shared by every LazyPosition into it. Line starts are only
+# found the first time a line or column is asked for
+class Source:
+    __slots__ = ('fn', 'text', 'line_starts')
+
+    def __init__(self, fn, text):
+        self.fn = fn
+        self.text = text
+        self.line_starts = None
+
+    def line_col(self, idx):
+        if self.line_starts is None:
+            self.line_starts = [0] + [match.end() for match in re.finditer('\n', self.text)]
+        ln = bisect_right(self.line_starts, idx) - 1
+        return ln, idx - self.line_starts[ln]
+
+# position that is only an index into a Source, line and column are worked
+# out when an error message asks for them. It is never advanced, so copies
+# can share it
+class LazyPosition:
+    __slots__ = ('idx', 'source')
+
+    def __init__(self, idx, source):
+        self.idx = idx
+        self.source = source
+
+    @property
+    def fn(self):
+        return self.source.fn
+
+    @property
+    def ftxt(self):
+        return self.source.text
+
+    @property
+    def ln(self):
+        return self.source.line_col(self.idx)[0]
+
+    @property
+    def col(self):
+        return self.source.line_col(self.idx)[1]
+
+    def copy(self):
+        return self
+
+    # pickled as a constructor call, much faster to load than slot state
+    def __reduce__(self):
+        return LazyPosition, (self.idx, self.source)
+
 #tokens
 INETEGER, FLOAT, IDENTIFIER, KEYWORD, EOF = 'INETEGER', 'FLOAT', 'IDENTIFIER', 'KEYWORD', 'EOF'
 PLUS, MINUS, MULTIPLY, DIVIDE, POWER, EQUALS, LPARENT, RPARENT = 'PLUS', 'MINUS', 'MULTIPLY', 'DIVIDE', 'POWER', 'EQUALS', 'LPARENT', 'RPARENT'
@@ -102,25 +170,32 @@ KEYWORDS = [
     'STEP',
     'WHILE',
     'FUN',
-    'DO'
+    'DO',
+    'MEMO'
 ]
 
 
 class Token:
+    __slots__ = ('type', 'value', 'pos_start', 'pos_end')
+
     def __init__(self, type_, value=None, pos_start=None, pos_end=None):
         self.type = type_
         self.value = value
 
         if pos_start:
             self.pos_start = pos_start.copy()
-            self.pos_end = pos_start.copy()
-            self.pos_end.advance()
+            if not pos_end:
+                self.pos_end = pos_start.copy()
+                self.pos_end.advance()
 
         if pos_end:
             self.pos_end = pos_end.copy()
 
     def matches(self, type_, value):
         return self.type == type_ and self.value == value
+
+    def __reduce__(self):
+        return Token, (self.type, self.value, self.pos_start, self.pos_end)
     
     def __repr__(self):
         if self.value: return f'{self.type}:{self.value}'
@@ -295,10 +370,93 @@ class Lexer:
 
         return Token(tok_type, pos_start=pos_start, pos_end=self.pos)
 
+# one pattern for every token and the spaces before it, each group is named
+# after the token type it produces. Longer operators come before their prefixes
+# and FLOAT before INETEGER, the same choices the character loop in Lexer makes
+SPACE_PATTERN = re.compile(r'[ \t]*')
+TOKEN_PATTERN = re.compile(r'''[ \t]*(?:
+      (?P<FLOAT>[0-9]+\.[0-9]*)
+    | (?P<INETEGER>[0-9]+)
+    | (?P<IDENTIFIER>[A-Za-z][A-Za-z0-9_]*)
+    | (?P<STRING>"[^"]*"?)
+    | (?P<ARROW>->)
+    | (?P<DOUBLEEQUALS>==)
+    | (?P<NOTEQUALS>!=)
+    | (?P<LESSTHANEQUALS><=)
+    | (?P<GREATERTHANEQUALS>>=)
+    | (?P<PLUS>\+)
+    | (?P<MINUS>-)
+    | (?P<MULTIPLY>\*)
+    | (?P<DIVIDE>/)
+    | (?P<POWER>\^)
+    | (?P<LPARENT>\()
+    | (?P<RPARENT>\))
+    | (?P<LBRACKET>\[)
+    | (?P<RBRACKET>\])
+    | (?P<EQUALS>=)
+    | (?P<LESSTHAN><)
+    | (?P<GREATERTHAN>>)
+    | (?P<COMMA>,)
+)''', re.VERBOSE)
+
+# same tokens, positions and errors as Lexer, but scanned with TOKEN_PATTERN
+# instead of one character at a time
+class RegexLexer(Lexer):
+    def __init__(self, fn, text):
+        self.fn = fn
+        self.text = text
+
+    def make_tokens(self):
+        text = self.text
+        source = Source(self.fn, text)
+        match = TOKEN_PATTERN.match
+        keywords = set(KEYWORDS)
+        tokens = []
+        idx = 0
+
+        while True:
+            found = match(text, idx)
+
+            if not found:
+                # idx is already past the end after an unterminated string
+                if idx < len(text): idx = SPACE_PATTERN.match(text, idx).end()
+                if idx >= len(text): break
+
+                pos_start = LazyPosition(idx, source)
+                if text[idx] == '!':
+                    return [], ExpectedCharError(pos_start, LazyPosition(idx + 2, source), "'=' (after '!')")
+                return [], UnwantedCharError(pos_start, LazyPosition(idx + 1, source), "'" + text[idx] + "'")
+
+            tok_type = found.lastgroup
+            start, idx = found.span(tok_type)
+
+            if tok_type == IDENTIFIER:
+                value = found.group(tok_type)
+                if value in keywords: tok_type = KEYWORD
+            elif tok_type == INETEGER:
+                value = int(found.group(tok_type))
+            elif tok_type == FLOAT:
+                value = float(found.group(tok_type))
+            elif tok_type == STRING:
+                terminated = idx - start > 1 and text[idx - 1] == '"'
+                value = text[start + 1:idx - 1] if terminated else text[start + 1:idx]
+                # an unterminated string steps past the end of the text like Lexer does
+                if not terminated: idx += 1
+            else:
+                value = None
+
+            tokens.append(Token(tok_type, value, LazyPosition(start, source), LazyPosition(idx, source)))
+
+        tokens.append(Token(EOF, pos_start=LazyPosition(idx, source), pos_end=LazyPosition(idx + 1, source)))
+        return tokens, None
+
 
 # Nodes
+# every node lists its attributes in __slots__, a big AST is mostly nodes
 
 class NumNode:
+    __slots__ = ('tok', 'pos_start', 'pos_end')
+
     def __init__(self, tok):
         self.tok = tok
 
@@ -309,6 +467,8 @@ class NumNode:
         return f'{self.tok}'
 
 class StringNode:
+    __slots__ = ('tok', 'pos_start', 'pos_end')
+
     def __init__(self, tok):
         self.tok = tok
 
@@ -319,6 +479,8 @@ class StringNode:
         return f'{self.tok}'
     
 class ListNode:
+    __slots__ = ('element_nodes', 'pos_start', 'pos_end')
+
     def __init__(self, element_nodes, pos_start, pos_end):
         self.element_nodes = element_nodes
         
@@ -326,25 +488,42 @@ class ListNode:
         self.pos_end = pos_end
 
 class VariableAccessNode:
+    __slots__ = ('variable_name_tok', 'depth', 'slot', 'pos_start', 'pos_end')
+
     def __init__(self, variable_name_tok):
         self.variable_name_tok = variable_name_tok
+        # address filled in by the Resolver, see SymbolTable.lookup
+        self.depth = None
+        self.slot = None
 
         self.pos_start = self.variable_name_tok.pos_start
         self.pos_end = self.variable_name_tok.pos_end
 
 class VariableAssignNode:
+    __slots__ = ('variable_name_tok', 'value_node', 'slot', 'pos_start', 'pos_end')
+
     def __init__(self, variable_name_tok, value_node):
         self.variable_name_tok = variable_name_tok
         self.value_node = value_node
+        self.slot = None
 
         self.pos_start = self.variable_name_tok.pos_start
         self.pos_end = self.value_node.pos_end
 
 class BinaryOpNode:
+    __slots__ = ('left_node', 'op_tok', 'right_node', 'method_name', 'num_op', 'short_circuit', 'pos_start', 'pos_end')
+
     def __init__(self, left_node, op_tok, right_node):
         self.left_node = left_node
         self.op_tok = op_tok
         self.right_node = right_node
+        # operator resolved once here instead of on every evaluation
+        key = op_key(op_tok)
+        self.method_name = BINARY_METHODS[key]
+        self.num_op = NUM_OPS.get(key)
+        # truth value of a Num left operand that decides the result on its
+        # own, set by mark_short_circuit when a run opts in
+        self.short_circuit = None
 
         self.pos_start = self.left_node.pos_start
         self.pos_end = self.right_node.pos_end
@@ -353,9 +532,15 @@ class BinaryOpNode:
         return f'({self.left_node}, {self.op_tok}, {self.right_node})'
 
 class UnaryOpNode:
+    __slots__ = ('op_tok', 'node', 'method_name', 'operand', 'num_op', 'pos_start', 'pos_end')
+
     def __init__(self, op_tok, node):
         self.op_tok = op_tok
         self.node = node
+        # method_name is None for unary plus, which returns the operand as is
+        key = op_key(op_tok)
+        self.method_name, self.operand = UNARY_METHODS.get(key, (None, None))
+        self.num_op = UNARY_NUM_OPS.get(key)
         # gets first element of tuple whch would be expression
         self.pos_start = self.op_tok.pos_start
         self.pos_end = node.pos_end
@@ -364,6 +549,8 @@ class UnaryOpNode:
         return f'({self.op_tok}, {self.node})'
 
 class IfNode:
+    __slots__ = ('cases', 'else_case', 'pos_start', 'pos_end')
+
     def __init__(self, cases, else_case):
         self.cases = cases
         self.else_case = else_case
@@ -372,29 +559,44 @@ class IfNode:
         self.pos_end = (self.else_case or self.cases[len(self.cases) - 1][0]).pos_end
 
 class ForNode:
+    __slots__ = ('variable_name_tok', 'start_value_node', 'end_value_node', 'step_value_node', 'body_node', 'slot', 'discard', 'lazy', 'pos_start', 'pos_end')
+
     def __init__(self, variable_name_tok, start_value_node, end_value_node, step_value_node, body_node):
         self.variable_name_tok = variable_name_tok
         self.start_value_node = start_value_node
         self.end_value_node = end_value_node
         self.step_value_node = step_value_node
         self.body_node = body_node
+        self.slot = None
+        # set by mark_loops
+        self.discard = False
+        self.lazy = False
 
         self.pos_start = self.variable_name_tok.pos_start
         self.pos_end = self.body_node.pos_end
 
 class WhileNode:
+    __slots__ = ('condition_node', 'body_node', 'discard', 'pos_start', 'pos_end')
+
     def __init__(self, condition_node, body_node):
         self.condition_node = condition_node
         self.body_node = body_node
+        self.discard = False
 
         self.pos_start = self.condition_node.pos_start
         self.pos_end = self.body_node.pos_end
 
 class FuncDefNode:
-    def __init__(self, variable_name_tok, arg_name_toks, body_node):
+    __slots__ = ('variable_name_tok', 'arg_name_toks', 'body_node', 'memo_size', 'slot', 'scope', 'pos_start', 'pos_end')
+
+    def __init__(self, variable_name_tok, arg_name_toks, body_node, memo_size=None):
         self.variable_name_tok = variable_name_tok
         self.arg_name_toks = arg_name_toks
         self.body_node = body_node
+        # LRU size for FUN MEMO, None for plain functions
+        self.memo_size = memo_size
+        self.slot = None
+        self.scope = None
 
         if self.variable_name_tok:
             self.pos_start = self.variable_name_tok.pos_start
@@ -406,9 +608,13 @@ class FuncDefNode:
         self.pos_end = self.body_node.pos_end
 
 class CallNode:
+    __slots__ = ('node_to_call', 'arg_nodes', 'tail', 'pos_start', 'pos_end')
+
     def __init__(self, node_to_call, arg_nodes):
         self.node_to_call = node_to_call
         self.arg_nodes = arg_nodes
+        # set by mark_tail_calls
+        self.tail = False
 
         self.pos_start = self.node_to_call.pos_start
 
@@ -417,6 +623,34 @@ class CallNode:
         else:
             self.pos_end = self.node_to_call.pos_end
 
+# direct sub-nodes of a node, in evaluation order
+def child_nodes(node):
+    if isinstance(node, ListNode):
+        return list(node.element_nodes)
+    if isinstance(node, VariableAssignNode):
+        return [node.value_node]
+    if isinstance(node, BinaryOpNode):
+        return [node.left_node, node.right_node]
+    if isinstance(node, UnaryOpNode):
+        return [node.node]
+    if isinstance(node, IfNode):
+        children = []
+        for condition, expr in node.cases:
+            children += [condition, expr]
+        if node.else_case: children.append(node.else_case)
+        return children
+    if isinstance(node, ForNode):
+        children = [node.start_value_node, node.end_value_node]
+        if node.step_value_node: children.append(node.step_value_node)
+        return children + [node.body_node]
+    if isinstance(node, WhileNode):
+        return [node.condition_node, node.body_node]
+    if isinstance(node, FuncDefNode):
+        return [node.body_node]
+    if isinstance(node, CallNode):
+        return [node.node_to_call] + node.arg_nodes
+    return []
+
 
 #parse
 class ParseResult:
@@ -868,6 +1102,17 @@ class Parser:
         res.register_advancement()
         self.advance()
 
+        memo_size = None
+        if self.current_tok.matches(KEYWORD, 'MEMO'):
+            memo_size = MEMO_SIZE
+            res.register_advancement()
+            self.advance()
+
+            if self.current_tok.type == INETEGER:
+                memo_size = self.current_tok.value
+                res.register_advancement()
+                self.advance()
+
         if self.current_tok.type == IDENTIFIER:
             variable_name_tok = self.current_tok
             res.register_advancement()
@@ -937,7 +1182,8 @@ class Parser:
         return res.success(FuncDefNode(
             variable_name_tok,
             arg_name_toks,
-            node_to_return
+            node_to_return,
+            memo_size
         ))
 
 
@@ -960,6 +1206,389 @@ class Parser:
         return res.success(left)
 
 
+# resolver
+# names bound inside one FUN body, in slot order (arguments first)
+class Scope:
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.names = []
+        self.index = {}
+
+    def declare(self, name):
+        if name not in self.index:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+        return self.index[name]
+
+# gives every variable a (depth, slot) address: depth is the number of FUN
+# frames to walk out, slot the index in that frame (None means a global)
+class Resolver:
+    def resolve(self, node):
+        self.visit(node, None)
+        return node
+
+    def visit(self, node, scope):
+        method_name = f'visit_{type(node).__name__}'
+        method = getattr(self, method_name, self.visit_children)
+        return method(node, scope)
+
+    def visit_children(self, node, scope):
+        for child in child_nodes(node):
+            self.visit(child, scope)
+
+    # every name a FUN body binds in its own frame, nested FUN bodies excluded
+    def declare(self, node, scope):
+        if isinstance(node, VariableAssignNode):
+            scope.declare(node.variable_name_tok.value)
+        elif isinstance(node, ForNode):
+            scope.declare(node.variable_name_tok.value)
+        elif isinstance(node, FuncDefNode):
+            if node.variable_name_tok:
+                scope.declare(node.variable_name_tok.value)
+            return
+
+        for child in child_nodes(node):
+            self.declare(child, scope)
+
+    def visit_VariableAccessNode(self, node, scope):
+        name = node.variable_name_tok.value
+        depth = 0
+
+        while scope and name not in scope.index:
+            scope = scope.parent
+            depth += 1
+
+        node.depth = depth
+        node.slot = scope.index[name] if scope else None
+
+    def visit_VariableAssignNode(self, node, scope):
+        self.visit(node.value_node, scope)
+        if scope: node.slot = scope.index[node.variable_name_tok.value]
+
+    def visit_ForNode(self, node, scope):
+        self.visit_children(node, scope)
+        if scope: node.slot = scope.index[node.variable_name_tok.value]
+
+    def visit_FuncDefNode(self, node, scope):
+        if node.variable_name_tok and scope:
+            node.slot = scope.index[node.variable_name_tok.value]
+
+        node.scope = Scope(scope)
+        for arg_name_tok in node.arg_name_toks:
+            node.scope.declare(arg_name_tok.value)
+        self.declare(node.body_node, node.scope)
+
+        self.visit(node.body_node, node.scope)
+
+
+# memo
+# MEMO results are reused for equal arguments, so a MEMO body may not bind
+# names and may only read its arguments and the variables of its FOR loops
+# (those live in its own frame). It may call itself, its arguments, the
+# other MEMO functions of the program and those named in memo_names.
+# This runs after the optimizer: a TRUE, FALSE or NULL it folded is no
+# longer read, one it left is a global like any other. The error for the
+# first body that breaks this, or None
+def memo_error(node, memo_names=()):
+    functions = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, FuncDefNode) and node.memo_size is not None: functions.append(node)
+        stack += child_nodes(node)
+    callees = {function.variable_name_tok.value for function in functions if function.variable_name_tok}
+    callees.update(memo_names)
+
+    for function in functions:
+        binding = first_binding(function.body_node)
+        if binding:
+            return InvalidSyntaxError(
+                binding.pos_start, binding.pos_end,
+                "MEMO function bodies can not assign variables"
+            )
+
+        free_read = first_free_read(function.body_node, {arg_name_tok.value for arg_name_tok in function.arg_name_toks}, callees)
+        if free_read:
+            return InvalidSyntaxError(
+                free_read.pos_start, free_read.pos_end,
+                f"MEMO function bodies can only read their own arguments and call MEMO functions, not '{free_read.variable_name_tok.value}'"
+            )
+    return None
+
+# names of the MEMO functions among the globals of a symbol table
+def memo_functions(symbol_table):
+    return tuple(sorted(name for name, value in symbol_table.symbols.items() if type(value) is Function and value.memo))
+
+# first VARIABLE or named FUN anywhere in node, None if there is none
+def first_binding(node):
+    if isinstance(node, VariableAssignNode):
+        return node
+    if isinstance(node, FuncDefNode) and node.variable_name_tok:
+        return node
+    for child in child_nodes(node):
+        binding = first_binding(child)
+        if binding: return binding
+    return None
+
+# first variable read in node of a name that is not in names, None if there
+# is none. A name called as a function may also be one of callees. FOR
+# bodies may read their loop variable and anonymous FUN bodies their arguments
+def first_free_read(node, names, callees):
+    if isinstance(node, VariableAccessNode):
+        return None if node.variable_name_tok.value in names else node
+
+    if isinstance(node, CallNode) and isinstance(node.node_to_call, VariableAccessNode) and node.node_to_call.variable_name_tok.value in callees:
+        children = node.arg_nodes
+    elif isinstance(node, FuncDefNode):
+        names = names | {arg_name_tok.value for arg_name_tok in node.arg_name_toks}
+        children = child_nodes(node)
+    elif isinstance(node, ForNode):
+        children = child_nodes(node)[:-1]
+        free_read = first_free_read(node.body_node, names | {node.variable_name_tok.value}, callees)
+        if free_read: return free_read
+    else:
+        children = child_nodes(node)
+
+    for child in children:
+        free_read = first_free_read(child, names, callees)
+        if free_read: return free_read
+    return None
+
+
+# loops
+# an expression without bindings or calls: its value only depends on the variables it reads
+def is_pure(node):
+    if isinstance(node, (VariableAssignNode, ForNode, WhileNode, FuncDefNode, CallNode)):
+        return False
+    for child in child_nodes(node):
+        if not is_pure(child): return False
+    return True
+
+# flags loops whose list can never be looked at (discard) and FOR loops whose
+# elements can be recomputed on demand instead of kept alive (lazy).
+# Conditions only ask is_true(), which is always false for a List, so loops
+# there, in the branches of an IF there and in the body of such loops are discarded.
+# discard starts out True for a program run as a statement, see run()
+def mark_loops(node, discard=False):
+    if isinstance(node, IfNode):
+        for condition, expr in node.cases:
+            mark_loops(condition, True)
+            mark_loops(expr, discard)
+        if node.else_case: mark_loops(node.else_case, discard)
+
+    elif isinstance(node, ForNode):
+        node.discard = discard
+        node.lazy = not discard and is_pure(node.body_node)
+        for child in child_nodes(node)[:-1]:
+            mark_loops(child)
+        mark_loops(node.body_node, discard)
+
+    elif isinstance(node, WhileNode):
+        node.discard = discard
+        mark_loops(node.condition_node, True)
+        mark_loops(node.body_node, discard)
+
+    else:
+        for child in child_nodes(node):
+            mark_loops(child)
+
+# flags calls whose value is the value of the function body they are in:
+# the body itself, or an IF branch in tail position. Such calls reuse the
+# caller's frame, see Function.execute and the VM's TAIL_CALL
+def mark_tail_calls(node, tail=False):
+    if isinstance(node, CallNode):
+        node.tail = tail
+
+    if isinstance(node, FuncDefNode):
+        mark_tail_calls(node.body_node, True)
+
+    elif isinstance(node, IfNode):
+        for condition, expr in node.cases:
+            mark_tail_calls(condition)
+            mark_tail_calls(expr, tail)
+        if node.else_case: mark_tail_calls(node.else_case, tail)
+
+    else:
+        for child in child_nodes(node):
+            mark_tail_calls(child)
+
+# ADDITIONALLY is decided by a false Num on the left, ALTERNATIVELY by a true one
+SHORT_CIRCUIT = {
+    'additionally': False,
+    'alternatively': True,
+}
+
+# opt-in: skip the right operand of ADDITIONALLY/ALTERNATIVELY when the left
+# one decides the result. Off by default since the right operand's side
+# effects and errors then no longer happen.
+def mark_short_circuit(node):
+    if isinstance(node, BinaryOpNode):
+        node.short_circuit = SHORT_CIRCUIT.get(node.method_name)
+    for child in child_nodes(node):
+        mark_short_circuit(child)
+
+
+# optimizer
+# TRUE, FALSE and NULL are plain globals, a script may rebind them
+CONSTANT_NAMES = ('TRUE', 'FALSE', 'NULL')
+
+# results bigger than this are left for run time instead of being kept in the tree
+FOLD_MAX_EXPONENT = 256
+FOLD_MAX_STRING = 1024
+
+# Num values of the constant names in a symbol table, as the optimizer wants them
+def constant_values(symbol_table):
+    values = {}
+    for name in CONSTANT_NAMES:
+        value = symbol_table.symbols.get(name)
+        if type(value) is Num: values[name] = value.value
+    return values
+
+# every name a VARIABLE, FOR or named FUN binds anywhere in node
+def bound_names(node):
+    names = set()
+    binding = node.variable_name_tok if isinstance(node, (VariableAssignNode, ForNode, FuncDefNode)) else None
+    if binding: names.add(binding.value)
+    for child in child_nodes(node):
+        names |= bound_names(child)
+    return names
+
+# folds operators whose operands are literals into one literal and drops IF
+# cases whose condition is a literal. Outside FUN bodies the constant names
+# are replaced by the values they had when the program was parsed, unless the
+# program binds them itself. An operation that fails is left alone, so its
+# error still happens at run time and at the same position.
+class Optimizer:
+    def __init__(self, constants=None):
+        self.constants = constants or {}
+
+    def optimize(self, node):
+        bound = bound_names(node)
+        self.constants = {name: value for name, value in self.constants.items() if name not in bound}
+        return self.visit(node, True)
+
+    def visit(self, node, top_level):
+        method_name = f'visit_{type(node).__name__}'
+        method = getattr(self, method_name, self.visit_literal)
+        return method(node, top_level)
+
+    def visit_literal(self, node, top_level):
+        return node
+
+    def visit_ListNode(self, node, top_level):
+        node.element_nodes = [self.visit(element_node, top_level) for element_node in node.element_nodes]
+        return node
+
+    def visit_VariableAccessNode(self, node, top_level):
+        name = node.variable_name_tok.value
+        if top_level and name in self.constants:
+            return literal(self.constants[name], node)
+        return node
+
+    def visit_VariableAssignNode(self, node, top_level):
+        node.value_node = self.visit(node.value_node, top_level)
+        return node
+
+    # an illegal operation is reported over the operands' spans, so an
+    # operand keeps its own even when it is replaced
+    def visit_operand(self, node, top_level):
+        optimized = self.visit(node, top_level)
+        if optimized is node: return node
+        if is_literal(optimized): return literal(optimized.tok.value, node)
+
+        # only an IF is ever replaced by something that is not a literal
+        node.cases, node.else_case = [(literal(1, node), optimized)], None
+        return node
+
+    def visit_BinaryOpNode(self, node, top_level):
+        node.left_node = self.visit_operand(node.left_node, top_level)
+        node.right_node = self.visit_operand(node.right_node, top_level)
+        if not (is_literal(node.left_node) and is_literal(node.right_node)): return node
+
+        left, right = node.left_node.tok.value, node.right_node.tok.value
+        if node.method_name == 'topowerof' and not (type(right) is int and abs(right) <= FOLD_MAX_EXPONENT):
+            return node
+        if isinstance(left, str) and type(right) is int and len(left) * right > FOLD_MAX_STRING:
+            return node
+        return self.fold(node)
+
+    def visit_UnaryOpNode(self, node, top_level):
+        node.node = self.visit_operand(node.node, top_level)
+        if not is_literal(node.node): return node
+        return self.fold(node)
+
+    def visit_IfNode(self, node, top_level):
+        cases = []
+        for condition, expr in node.cases:
+            condition = self.visit(condition, top_level)
+            expr = self.visit(expr, top_level)
+
+            if not is_literal(condition):
+                cases.append((condition, expr))
+            elif literal_is_true(condition):
+                # nothing after the first case that always holds is ever reached
+                if not cases: return expr
+                node.cases, node.else_case = cases, expr
+                return node
+
+        else_case = self.visit(node.else_case, top_level) if node.else_case else None
+        if not cases:
+            # no case can hold, an IF without ELSE still has to give None
+            if else_case: return else_case
+            return node
+
+        node.cases, node.else_case = cases, else_case
+        return node
+
+    def visit_ForNode(self, node, top_level):
+        node.start_value_node = self.visit(node.start_value_node, top_level)
+        node.end_value_node = self.visit(node.end_value_node, top_level)
+        if node.step_value_node:
+            node.step_value_node = self.visit(node.step_value_node, top_level)
+        node.body_node = self.visit(node.body_node, top_level)
+        return node
+
+    def visit_WhileNode(self, node, top_level):
+        node.condition_node = self.visit(node.condition_node, top_level)
+        node.body_node = self.visit(node.body_node, top_level)
+        return node
+
+    def visit_FuncDefNode(self, node, top_level):
+        # a body runs later, against whatever the constant names hold by then
+        node.body_node = self.visit(node.body_node, False)
+        return node
+
+    def visit_CallNode(self, node, top_level):
+        node.node_to_call = self.visit(node.node_to_call, top_level)
+        node.arg_nodes = [self.visit(arg_node, top_level) for arg_node in node.arg_nodes]
+        return node
+
+    # value of an operation on literals as a literal spanning the operation
+    def fold(self, node):
+        context = Context('<optimizer>')
+        context.symbol_table = SymbolTable()
+        try:
+            res = Interpreter().visit(node, context)
+        except Exception:
+            return node
+
+        if res.error or type(res.value) not in (Num, String): return node
+        return literal(res.value.value, node)
+
+def is_literal(node):
+    return isinstance(node, (NumNode, StringNode))
+
+# same as is_true() on the value the literal evaluates to
+def literal_is_true(node):
+    if isinstance(node, StringNode): return len(node.tok.value) >= 1
+    return node.tok.value != 0
+
+def literal(value, node):
+    if isinstance(value, str):
+        return StringNode(Token(STRING, value, node.pos_start, node.pos_end))
+    return NumNode(Token(INETEGER if type(value) is int else FLOAT, value, node.pos_start, node.pos_end))
+
+
 # RunTime
 class RunTimeResult:
     def __init__(self):
@@ -979,10 +1608,12 @@ class RunTimeResult:
         return self
 
 #values
+# Values are never changed once made, so they can be shared freely. Positions
+# and context are only filled in (on a copy) where an operation may fail.
 class Value:
-    def __init__(self):
-        self.set_pos()
-        self.set_context()
+    pos_start = None
+    pos_end = None
+    context = None
 
     def set_pos(self, pos_start=None, pos_end=None):
         self.pos_start = pos_start
@@ -1035,7 +1666,7 @@ class Value:
     def notted(self, other):
         return None, self.illegal_operation(other)
 
-    def execute(self, args):
+    def execute(self, args, interpreter=None, caller=None):
         return RunTimeResult().failure(self.illegal_operation())
 
     def copy(self):
@@ -1044,6 +1675,17 @@ class Value:
     def is_true(self):
         return False
 
+    # counts size bytes of a value about to be made from self and other
+    # against the memory limit of the run, None when it fits
+    def allocate(self, size, other):
+        meter = self.context.symbol_table.root.meter if self.context else SymbolTable.meter
+        if meter.allocate(size): return None
+        return RunTimeError(
+            self.pos_start, other.pos_end,
+            'Memory limit exceeded',
+            self.context
+        )
+
     def illegal_operation(self, other=None):
         if not other: other = self
         return RunTimeError(
@@ -1054,7 +1696,6 @@ class Value:
 
 class Num(Value):
     def __init__(self, value):
-        super().__init__()
         self.value = value
 
     def plussed(self, other):
@@ -1156,20 +1797,91 @@ class Num(Value):
     
     def __repr__(self):
         return str(self.value)
+
+# shared Num objects for the ints scripts use most
+SMALL_INT_MIN, SMALL_INT_MAX = -128, 1024
+SMALL_INTS = [Num(i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1)]
+
+def make_num(value):
+    if type(value) is int and SMALL_INT_MIN <= value <= SMALL_INT_MAX:
+        return SMALL_INTS[value - SMALL_INT_MIN]
+    return Num(value)
+
+# operations on raw Num values, plain functions so nodes holding them can be pickled
+def num_equals(a, b): return int(a == b)
+def num_notequals(a, b): return int(a != b)
+def num_lessthan(a, b): return int(a < b)
+def num_greaterthan(a, b): return int(a > b)
+def num_lessthanequals(a, b): return int(a <= b)
+def num_greaterthanequals(a, b): return int(a >= b)
+def num_additionally(a, b): return int(a and b)
+def num_alternatively(a, b): return int(a or b)
+def num_negated(a): return a * -1
+def num_notted(a): return 1 if a == 0 else 0
+
+# Num with Num operations, division is handled by the caller
+NUM_OPS = {
+    PLUS: operator.add,
+    MINUS: operator.sub,
+    MULTIPLY: operator.mul,
+    POWER: operator.pow,
+    DOUBLEEQUALS: num_equals,
+    NOTEQUALS: num_notequals,
+    LESSTHAN: num_lessthan,
+    GREATERTHAN: num_greaterthan,
+    LESSTHANEQUALS: num_lessthanequals,
+    GREATERTHANEQUALS: num_greaterthanequals,
+    (KEYWORD, 'ADDITIONALLY'): num_additionally,
+    (KEYWORD, 'ALTERNATIVELY'): num_alternatively,
+}
+
+UNARY_NUM_OPS = {
+    MINUS: num_negated,
+    (KEYWORD, 'NOT'): num_notted,
+}
+
+# method called on the left operand for each binary operator
+BINARY_METHODS = {
+    PLUS: 'plussed',
+    MINUS: 'minused',
+    MULTIPLY: 'multiplied',
+    DIVIDE: 'divided',
+    POWER: 'topowerof',
+    DOUBLEEQUALS: 'get_equals',
+    NOTEQUALS: 'get_notequals',
+    LESSTHAN: 'get_lessthan',
+    GREATERTHAN: 'get_greaterthan',
+    LESSTHANEQUALS: 'get_lessthanequals',
+    GREATERTHANEQUALS: 'get_greaterthanequals',
+    (KEYWORD, 'ADDITIONALLY'): 'additionally',
+    (KEYWORD, 'ALTERNATIVELY'): 'alternatively',
+}
+
+# method called on the operand of a unary operator and the Num it is called with
+UNARY_METHODS = {
+    MINUS: ('multiplied', -1),
+    (KEYWORD, 'NOT'): ('notted', None),
+}
+
+def op_key(op_tok):
+    return (op_tok.type, op_tok.value) if op_tok.type == KEYWORD else op_tok.type
     
 class String(Value):
     def __init__(self, value):
-        super().__init__()
         self.value = value
         
     def plussed(self, other):
         if isinstance(other, String):
+            error = self.allocate(len(self.value) + len(other.value), other)
+            if error: return None, error
             return String(self.value + other.value).set_context(self.context), None
         else:
             return None, Value.illegal_operation(self, other)
     
     def multiplied(self, other):
         if isinstance(other, Num):
+            error = self.allocate(len(self.value) * max(other.value, 0), other)
+            if error: return None, error
             return String(self.value * other.value).set_context(self.context), None
         else:
             return None, Value.illegal_operation(self, other)
@@ -1186,32 +1898,44 @@ class String(Value):
     def __repr__(self):
         return str(self.value)
     
+# bytes accounted for each element of a List, see Meter.allocate
+REFERENCE_SIZE = 8
+
 class List(Value):
+        # elements are held in a persistent vector, so copies share it and
+        # every operation returns a new vector that shares what it can
         def __init__(self, elements):
-            super().__init__()
-            self.elements = elements
+            self.elements = elements if isinstance(elements, (PVector, LoopElements)) else PVector(elements)
         
         def minused(self, other):
             if isinstance(other, Num):
-                new_list = self.copy()
                 try:
-                    new_list.elements.pop(other.value)
-                    return new_list,None    
+                    return self.with_elements(self.elements.delete(other.value)),None    
+                except LoopElementError as exception:
+                    return None, exception.error
                 except:
                     return None, RunTimeError(other.pos_start, other.pos_end, 'Index uout of bounds', self.context)
             else:
                 return None, Value.illegal_operation(self, other)
         
         def plussed(self, other):
-            new_list = self.copy()
-            new_list.elements.append(other)
-            return new_list, None
+            error = self.allocate(REFERENCE_SIZE, other)
+            if error: return None, error
+            try:
+                return self.with_elements(self.elements.append(other)), None
+            except LoopElementError as exception:
+                return None, exception.error
         
+        # the vectors share their chunks, but the result is accounted at its
+        # full length: that is what walking or printing it will cost
         def multiplied(self, other):
             if isinstance(other, List):
-                new_list = self.copy()
-                new_list.elements.extend(other.elements)
-                return new_list,None    
+                error = self.allocate(REFERENCE_SIZE * (len(self.elements) + len(other.elements)), other)
+                if error: return None, error
+                try:
+                    return self.with_elements(self.elements.concat(other.elements)),None    
+                except LoopElementError as exception:
+                    return None, exception.error
             else:
                 return None, Value.illegal_operation(self, other)
             
@@ -1219,60 +1943,196 @@ class List(Value):
             if isinstance(other, Num):
                 try:
                     return self.elements[other.value],None    
+                except LoopElementError as exception:
+                    return None, exception.error
                 except:
                     return None, RunTimeError(other.pos_start, other.pos_end, 'Index uout of bounds', self.context)
             else:
                 return None, Value.illegal_operation(self, other)
+
+        def with_elements(self, elements):
+            new_list = List(elements)
+            new_list.set_pos(self.pos_start, self.pos_end)
+            new_list.set_context(self.context)
+            return new_list
             
         def copy(self):
-            copy = List(self.elements[:])
-            copy.set_pos(self.pos_start, self.pos_end)
-            copy.set_context(self.context)
-            return copy
+            return self.with_elements(self.elements)
         
         def __repr__(self):
-            return f'[{", ".join([str(x) for x in self.elements])}]'
+            try:
+                return f'[{", ".join([str(x) for x in self.elements])}]'
+            except LoopElementError as exception:
+                return f'<{exception.error.error_name}: {exception.error.details}>'
         
         
+# raised by LoopElements when rebuilding an element fails, the List
+# operation that asked for the element returns error instead
+class LoopElementError(Exception):
+    def __init__(self, error):
+        super().__init__(error.details)
+        self.error = error
+
+# elements of a lazy FOR result. The loop already ran once (for its errors and
+# to count the iterations), so element k is rebuilt by evaluating the pure body
+# again with the loop variable at start + k * step and the other variables it
+# reads as they were when the loop finished. Indexed elements are kept, so
+# looking one up again is O(1); iterating streams them without keeping them.
+# Rebuilding counts against the Meter of whatever run is current.
+class LoopElements:
+    def __init__(self, node, context, start, step, length):
+        self.node = node
+        self.start = start
+        self.step = step
+        self.length = length
+        self.context = Context(context.display_name, context.parent, context.parent_entry_pos)
+        self.root = context.symbol_table.root
+        self.computed = {}
+        self.symbol_table = SymbolTable()
+        # variables are looked up by name here, the resolved addresses belong to the loop's frame
+        self.symbol_table.lexical = False
+
+        variable_name = node.variable_name_tok.value
+        for access_node in self.variable_nodes(node.body_node):
+            name = access_node.variable_name_tok.value
+            if name == variable_name: continue
+            value = context.symbol_table.lookup(name, access_node.depth, access_node.slot)
+            if value: self.symbol_table.set(name, value)
+
+    def variable_nodes(self, node):
+        if isinstance(node, VariableAccessNode):
+            return [node]
+        nodes = []
+        for child in child_nodes(node):
+            nodes += self.variable_nodes(child)
+        return nodes
+
+    def compute(self, k):
+        if k in self.computed: return self.computed[k]
+
+        self.symbol_table.meter = self.root.meter
+        context = Context(self.context.display_name, self.context.parent, self.context.parent_entry_pos)
+        context.symbol_table = SymbolTable(self.symbol_table)
+        context.symbol_table.set(self.node.variable_name_tok.value, make_num(self.start + k * self.step))
+        res = Interpreter().visit(self.node.body_node, context)
+        if res.error: raise LoopElementError(res.error)
+        return res.value
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for k in range(self.length):
+            yield self.compute(k)
+
+    def __getitem__(self, i):
+        i = operator.index(i)
+        if i < 0: i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError('List index out of range')
+        if i not in self.computed: self.computed[i] = self.compute(i)
+        return self.computed[i]
+
+    # anything that builds a new list works on a materialised copy
+    def append(self, value):
+        return PVector(self).append(value)
+
+    def delete(self, i):
+        return PVector(self).delete(i)
+
+    def concat(self, other):
+        return PVector(self).concat(other)
+
+
 class Function(Value):
-    def __init__(self, name, body_node, arg_names):
-        super().__init__()
+    def __init__(self, name, body_node, arg_names, scope=None, memo=None):
         self.name = name or "<anonymous>"
         self.body_node = body_node
         self.arg_names = arg_names
+        self.scope = scope
+        # Memo of a FUN MEMO, shared by all copies of the function
+        self.memo = memo
+
+    # context of a call with the arguments bound to it
+    def enter(self, args):
+        # a call is a step of the run
+        meter = self.context.symbol_table.root.meter
+        meter.calls += 1
+        meter.countdown -= 1
+        if not meter.countdown:
+            error = meter.check(self, self.context)
+            if error: return None, error
 
-    def execute(self, args):
-        res = RunTimeResult()
-        interpreter = Interpreter()
         new_context = Context(self.name, self.context, self.pos_start)
-        new_context.symbol_table = SymbolTable(new_context.parent.symbol_table)
+        new_context.symbol_table = SymbolTable(new_context.parent.symbol_table, self.scope)
 
         if len(args) > len(self.arg_names):
-            return res.failure(RunTimeError(
+            return None, RunTimeError(
                 self.pos_start, self.pos_end,
                 f"{len(args) - len(self.arg_names)} too many args passed into '{self.name}'",
                 self.context
-            ))
+            )
         
         if len(args) < len(self.arg_names):
-            return res.failure(RunTimeError(
+            return None, RunTimeError(
                 self.pos_start, self.pos_end,
                 f"{len(self.arg_names) - len(args)} too few args passed into '{self.name}'",
                 self.context
-            ))
+            )
 
         for i in range(len(args)):
             arg_name = self.arg_names[i]
             arg_value = args[i]
-            arg_value.set_context(new_context)
+            # a function passed in resolves its free names through this call
+            if isinstance(arg_value, Function):
+                arg_value = arg_value.copy().set_context(new_context)
             new_context.symbol_table.set(arg_name, arg_value)
 
-        value = res.register(interpreter.visit(self.body_node, new_context))
-        if res.error: return res
-        return res.success(value)
+        return new_context, None
+
+    # interpreter is the one making the call, so a Profiler sees the body too.
+    # caller is the context of the call, where a failure to enter is reported
+    def execute(self, args, interpreter=None, caller=None):
+        res = RunTimeResult()
+        if interpreter is None: interpreter = Interpreter()
+
+        if self.memo:
+            key = memo_key(args)
+            if key is not None:
+                found, value = self.memo.get(key)
+                if found: return res.success(value)
+
+                value = res.register(self.execute_body(interpreter, args, caller))
+                if res.error: return res
+                self.memo.store(key, value)
+                return res.success(value)
+
+        return self.execute_body(interpreter, args, caller)
+
+    # a call in tail position comes back as a TailCall, which is run here in
+    # a loop instead of one Python frame deeper
+    def execute_body(self, interpreter, args, caller=None):
+        res = RunTimeResult()
+        function = self
+
+        meter = self.context.symbol_table.root.meter
+        error = meter.enter(self, caller or self.context)
+        if error: return res.failure(error)
+
+        try:
+            while True:
+                new_context, error = function.enter(args)
+                if error: return res.failure(error)
+
+                value = res.register(interpreter.visit(function.body_node, new_context))
+                if res.error: return res
+                if type(value) is not TailCall: return res.success(value)
+                function, args = value.function, value.args
+        finally:
+            meter.leave()
 
     def copy(self):
-        copy = Function(self.name, self.body_node, self.arg_names)
+        copy = Function(self.name, self.body_node, self.arg_names, self.scope, self.memo)
         copy.set_context(self.context)
         copy.set_pos(self.pos_start, self.pos_end)
         return copy
@@ -1280,6 +2140,152 @@ class Function(Value):
     def __repr__(self):
         return f"<function {self.name}>"
 
+# cached results of a FUN MEMO, least recently used ones are dropped first
+MEMO_SIZE = 1024
+
+class Memo:
+    def __init__(self, size=MEMO_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return True, self.entries[key]
+        self.misses += 1
+        return False, None
+
+    def store(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def __repr__(self):
+        return f'<memo {len(self.entries)}/{self.size} hits={self.hits} misses={self.misses}>'
+
+# hashable key for argument values, by type and contents. None when an
+# argument has no such key (functions, missing values, lazy loop results),
+# then the call is not cached
+def memo_key(values):
+    key = []
+    for value in values:
+        if type(value) is Num:
+            key.append((type(value.value), value.value))
+        elif type(value) is String:
+            key.append((str, value.value))
+        elif type(value) is List:
+            # a lazy loop result would have to be rebuilt in full for its key
+            if type(value.elements) is LoopElements: return None
+            elements = memo_key(value.elements)
+            if elements is None: return None
+            key.append((List, elements))
+        else:
+            return None
+    return tuple(key)
+
+# a call left for Function.execute to run once the current body is done
+class TailCall:
+    __slots__ = ('function', 'args')
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+
+# limits
+# what a run may use, None for no limit: steps counts loop iterations and
+# calls, depth the calls running at once, seconds the wall-clock time and
+# memory the bytes of the Strings and Lists it allocates, see Meter.allocate
+class Limits:
+    def __init__(self, steps=None, depth=None, seconds=None, memory=None):
+        self.steps = steps
+        self.depth = depth
+        self.seconds = seconds
+        self.memory = memory
+
+    def __repr__(self):
+        return f'<limits steps={self.steps} depth={self.depth} seconds={self.seconds} memory={self.memory}>'
+
+# steps between looks at the clock
+CHECK_INTERVAL = 1024
+
+# what a run has used of its Limits, kept on its globals table. Engines count
+# a step with
+#     meter.countdown -= 1
+#     if not meter.countdown: error = meter.check(node, context)
+# so the hot path is a decrement and a test. check() only runs when the
+# countdown hits zero, about every CHECK_INTERVAL steps or where the step
+# limit would be passed. With nothing to check the countdown starts at zero
+# and never gets back to it
+class Meter:
+    def __init__(self, limits=None):
+        self.limits = limits or Limits()
+        self.steps = 0
+        self.depth = 0
+        self.max_depth = self.limits.depth
+        self.allocated = 0
+        self.max_memory = self.limits.memory
+        self.calls = 0
+        self.list_copies = 0
+        self.deadline = None if self.limits.seconds is None else time.perf_counter() + self.limits.seconds
+        self.interval = self.countdown = self.next_interval()
+
+    def next_interval(self):
+        if self.limits.steps is None:
+            return 0 if self.deadline is None else CHECK_INTERVAL
+        return min(CHECK_INTERVAL, self.limits.steps - self.steps + 1)
+
+    # steps counted so far
+    def used(self):
+        return self.steps + self.interval - self.countdown
+
+    def check(self, node, context):
+        self.steps += self.interval
+        if self.limits.steps is not None and self.steps > self.limits.steps:
+            return self.failure(node, context, 'Step limit exceeded')
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            return self.failure(node, context, 'Time limit exceeded')
+
+        self.interval = self.countdown = self.next_interval()
+        return None
+
+    # a call of function from context is about to run, it stays entered
+    # until leave(). The function carries the span of the call
+    def enter(self, function, context):
+        if self.depth == self.max_depth:
+            return self.failure(function, context, 'Maximum recursion depth exceeded')
+        self.depth += 1
+        return None
+
+    def leave(self):
+        self.depth -= 1
+
+    # String and List operations, List literals and loops collecting their
+    # values call this with the bytes of the value they are about to make,
+    # False when it would go over the limit. Every allocation adds to
+    # allocated and nothing is taken off when a value is dropped, so this
+    # is the total a run allocates, not what is alive at any one time: a
+    # String built up one character at a time is counted at every length
+    # it had. That bounds the peak from above and keeps the check cheap
+    def allocate(self, size):
+        if self.max_memory is not None and self.allocated + size > self.max_memory:
+            return False
+        self.allocated += size
+        return True
+
+    # allocate() for a value made at node, the error when it does not fit
+    def allocate_at(self, size, node, context):
+        if self.allocate(size): return None
+        return self.failure(node, context, 'Memory limit exceeded')
+
+    def failure(self, node, context, details):
+        return RunTimeError(node.pos_start, node.pos_end, details, context)
+
+    def __repr__(self):
+        return f'<meter steps={self.used()} depth={self.depth} allocated={self.allocated}>'
+
 #context
 
 class Context:
@@ -1292,25 +2298,81 @@ class Context:
 
 # symbosl
 class SymbolTable:
-    def __init__(self, parent=None):
+    # the Meter of the run, set on the globals table by run()
+    meter = Meter()
+
+    def __init__(self, parent=None, scope=None):
         self.symbols = {}
         self.parent = parent
+        # FUN frames keep the names of their Scope in a flat list
+        self.scope = scope
+        self.slots = [None] * len(scope.names) if scope else None
+        self.root = parent.root if parent else self
+        # resolved addresses are only valid while the parent chain mirrors the source nesting
+        if parent:
+            self.lexical = parent.lexical and scope is not None and scope.parent is parent.scope
+        else:
+            self.lexical = scope is None
 
     def get(self, name):
-        value = self.symbols.get(name, None)
+        if self.slots is not None and name in self.scope.index:
+            value = self.slots[self.scope.index[name]]
+        else:
+            value = self.symbols.get(name, None)
         if value == None and self.parent:
             return self.parent.get(name)
         return value
 
+    def lookup(self, name, depth, slot):
+        if depth is None or not self.lexical:
+            return self.get(name)
+
+        # no enclosing FUN binds the name, so only the globals can hold it
+        if slot is None:
+            return self.root.symbols.get(name, None)
+
+        table = self
+        for _ in range(depth):
+            table = table.parent
+
+        value = table.slots[slot]
+        if value == None and table.parent:
+            return table.parent.get(name)
+        return value
+
     def set(self, name, value):
-        self.symbols[name] = value
+        if self.slots is not None and name in self.scope.index:
+            self.slots[self.scope.index[name]] = value
+        else:
+            self.symbols[name] = value
+
+    def assign(self, name, slot, value):
+        if slot is None:
+            self.set(name, value)
+        else:
+            self.slots[slot] = value
 
     def remove(self, name):
-        del self.symbols[name]
+        if self.slots is not None and name in self.scope.index:
+            self.slots[self.scope.index[name]] = None
+        else:
+            del self.symbols[name]
 
 
 # INTERPRETER
 
+# copy of a value carrying the position of the node it came from, for the
+# operations that report errors through the value's own position and context
+def located(value, node, context):
+    if type(value) is List: context.symbol_table.root.meter.list_copies += 1
+    return value.copy().set_pos(node.pos_start, node.pos_end).set_context(context)
+
+# functions keep the context they were defined in, it is their parent scope
+def callee(value, node, context):
+    if isinstance(value, Function):
+        return value.copy().set_pos(node.pos_start, node.pos_end)
+    return located(value, node, context)
+
 
 class Interpreter:
     def visit(self, node, context):
@@ -1323,13 +2385,10 @@ class Interpreter:
 
 
     def visit_NumNode(self, node, context):
-        return RunTimeResult().success(
-            Num(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end)
-        )
+        return RunTimeResult().success(make_num(node.tok.value))
+
     def visit_StringNode(self, node, context):
-        return RunTimeResult().success(
-            String(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end)
-            )
+        return RunTimeResult().success(String(node.tok.value))
         
     def visit_ListNode(self, node, context):
         res = RunTimeResult()
@@ -1339,6 +2398,9 @@ class Interpreter:
             elements.append(res.register(self.visit(element_node, context)))
             if res.error: return res
 
+        error = context.symbol_table.root.meter.allocate_at(REFERENCE_SIZE * len(elements), node, context)
+        if error: return res.failure(error)
+
         return res.success(
         List(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
         )
@@ -1346,7 +2408,7 @@ class Interpreter:
     def visit_VariableAccessNode(self, node, context):
         res = RunTimeResult()
         variable_name = node.variable_name_tok.value
-        value = context.symbol_table.get(variable_name)
+        value = context.symbol_table.lookup(variable_name, node.depth, node.slot)
 
         if not value:
             return res.failure(RunTimeError(
@@ -1355,7 +2417,6 @@ class Interpreter:
                 context
             ))
 
-        value = value.copy().set_pos(node.pos_start, node.pos_end)
         return res.success(value)
 
     def visit_VariableAssignNode(self, node, context):
@@ -1364,64 +2425,55 @@ class Interpreter:
         value = res.register(self.visit(node.value_node, context))
         if res.error: return res
 
-        context.symbol_table.set(variable_name, value)
+        context.symbol_table.assign(variable_name, node.slot, value)
         return res.success(value)
 
     def visit_BinaryOpNode(self, node, context):
         res = RunTimeResult()
         left = res.register(self.visit(node.left_node, context))
         if res.error: return res
+
+        if node.short_circuit is not None and type(left) is Num and (left.value != 0) == node.short_circuit:
+            return res.success(make_num(int(left.value)))
+
         right = res.register(self.visit(node.right_node, context))
         if res.error: return res
 
-        if node.op_tok.type == PLUS:
-            result, error = left.plussed(right)
-        elif node.op_tok.type == MINUS:
-            result, error = left.minused(right)
-        elif node.op_tok.type == MULTIPLY:
-            result, error = left.multiplied(right)
-        elif node.op_tok.type == DIVIDE:
-            result, error = left.divided(right)
-        elif node.op_tok.type == POWER:
-            result, error = left.topowerof(right)
-        elif node.op_tok.type == DOUBLEEQUALS:
-            result, error = left.get_equals(right)
-        elif node.op_tok.type == NOTEQUALS:
-            result, error = left.get_notequals(right)
-        elif node.op_tok.type == LESSTHAN:
-            result, error = left.get_lessthan(right)
-        elif node.op_tok.type == GREATERTHAN:
-            result, error = left.get_greaterthan(right)
-        elif node.op_tok.type == LESSTHANEQUALS:
-            result, error = left.get_lessthanequals(right)
-        elif node.op_tok.type == GREATERTHANEQUALS:
-            result, error = left.get_greaterthanequals(right)
-        elif node.op_tok.matches(KEYWORD, 'ADDITIONALLY'):
-            result, error = left.additionally(right)
-        elif node.op_tok.matches(KEYWORD, 'ALTERNATIVELY'):
-            result, error = left.alternatively(right)
+        if type(left) is Num and type(right) is Num:
+            if node.num_op:
+                return res.success(make_num(node.num_op(left.value, right.value)))
+            if right.value == 0:
+                return res.failure(RunTimeError(
+                    node.right_node.pos_start, node.right_node.pos_end,
+                    'Division by zero',
+                    context
+                ))
+            return res.success(make_num(left.value / right.value))
+
+        left = located(left, node.left_node, context)
+        right = located(right, node.right_node, context)
+        result, error = getattr(left, node.method_name)(right)
 
         if error:
             return res.failure(error)
         else:
-            return res.success(result.set_pos(node.pos_start, node.pos_end))
+            return res.success(result)
 
     def visit_UnaryOpNode(self, node, context):
         res = RunTimeResult()
         num = res.register(self.visit(node.node, context))
         if res.error: return res
 
-        error = None
+        if node.method_name is None: return res.success(num)
+        if type(num) is Num: return res.success(make_num(node.num_op(num.value)))
 
-        if node.op_tok.type == MINUS:
-            num, error = num.multiplied(Num(-1))
-        elif node.op_tok.matches(KEYWORD, 'NOT'):
-            num, error = num.notted()
+        args = () if node.operand is None else (located(Num(node.operand), node, context),)
+        num, error = getattr(located(num, node.node, context), node.method_name)(*args)
 
         if error:
             return res.failure(error)
         else:
-            return res.success(num.set_pos(node.pos_start, node.pos_end))
+            return res.success(num)
 
     def visit_IfNode(self, node, context):
         res = RunTimeResult()
@@ -1445,6 +2497,7 @@ class Interpreter:
     def visit_ForNode(self, node, context):
         res = RunTimeResult()
         elements = []
+        count = 0
         start_value = res.register(self.visit(node.start_value_node, context))
         if res.error: return res
 
@@ -1463,13 +2516,31 @@ class Interpreter:
             condition = lambda: i < end_value.value
         else:
             condition = lambda: i > end_value.value
+
+        # element k of a lazy loop is rebuilt from start + k * step, which only matches for ints
+        lazy = node.lazy and type(i) is int and type(step_value.value) is int
+        collect = not (node.discard or lazy)
         
+        meter = context.symbol_table.root.meter
         while condition():
-            context.symbol_table.set(node.variable_name_tok.value, Num(i))
+            context.symbol_table.assign(node.variable_name_tok.value, node.slot, make_num(i))
             i += step_value.value
 
-            elements.append(res.register(self.visit(node.body_node, context)))
+            value = res.register(self.visit(node.body_node, context))
             if res.error: return res
+            if collect:
+                elements.append(value)
+                error = meter.allocate_at(REFERENCE_SIZE, node, context)
+                if error: return res.failure(error)
+            count += 1
+
+            meter.countdown -= 1
+            if not meter.countdown:
+                error = meter.check(node, context)
+                if error: return res.failure(error)
+
+        if lazy:
+            elements = LoopElements(node, context, start_value.value, step_value.value, count)
 
         return res.success(
             List(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
@@ -1478,6 +2549,7 @@ class Interpreter:
     def visit_WhileNode(self, node, context):
         res = RunTimeResult()
         elements = []
+        meter = context.symbol_table.root.meter
         
         while True:
             condition = res.register(self.visit(node.condition_node, context))
@@ -1485,8 +2557,17 @@ class Interpreter:
 
             if not condition.is_true(): break
 
-            elements.append(res.register(self.visit(node.body_node, context)))
+            value = res.register(self.visit(node.body_node, context))
             if res.error: return res
+            if not node.discard:
+                elements.append(value)
+                error = meter.allocate_at(REFERENCE_SIZE, node, context)
+                if error: return res.failure(error)
+
+            meter.countdown -= 1
+            if not meter.countdown:
+                error = meter.check(node, context)
+                if error: return res.failure(error)
 
         return res.success(
             List(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
@@ -1498,10 +2579,11 @@ class Interpreter:
         func_name = node.variable_name_tok.value if node.variable_name_tok else None
         body_node = node.body_node
         arg_names = [arg_name.value for arg_name in node.arg_name_toks]
-        func_value = Function(func_name, body_node, arg_names).set_context(context).set_pos(node.pos_start, node.pos_end)
+        memo = Memo(node.memo_size) if node.memo_size is not None else None
+        func_value = Function(func_name, body_node, arg_names, node.scope, memo).set_context(context).set_pos(node.pos_start, node.pos_end)
         
         if node.variable_name_tok:
-            context.symbol_table.set(func_name, func_value)
+            context.symbol_table.assign(func_name, node.slot, func_value)
 
         return res.success(func_value)
 
@@ -1511,37 +2593,512 @@ class Interpreter:
 
         value_to_call = res.register(self.visit(node.node_to_call, context))
         if res.error: return res
-        value_to_call = value_to_call.copy().set_pos(node.pos_start, node.pos_end)
+        value_to_call = callee(value_to_call, node, context)
 
         for arg_node in node.arg_nodes:
             args.append(res.register(self.visit(arg_node, context)))
             if res.error: return res
 
-        return_value = res.register(value_to_call.execute(args))
+        if node.tail and type(value_to_call) is Function and not value_to_call.memo:
+            return res.success(TailCall(value_to_call, args))
+
+        return_value = res.register(value_to_call.execute(args, self, context))
         if res.error: return res
         return res.success(return_value)
 
+# PROFILER
+# an Interpreter that times every node it visits. Nodes are keyed by their
+# source span, so every evaluation of the same node adds to one NodeStats.
+# A visit in a context other than the one of the frame it happens in is the
+# body of a call (Function.execute runs bodies with the calling interpreter),
+# which is how calls are found without the plain Interpreter doing anything.
+# Frames follow the calls as they are made, so the stacks are call stacks
+class NodeStats:
+    def __init__(self, node, name):
+        self.node = node
+        self.name = name
+        self.hits = 0
+        # total counts the outermost of nested visits only, so recursion is not counted twice
+        self.total = 0.0
+        self.own = 0.0
+        self.active = 0
+
+class Profiler(Interpreter):
+    def __init__(self):
+        self.nodes = {}
+        self.functions = {}
+        # self time by collapsed stack, 'f;g;h'
+        self.stacks = {}
+        # (context, collapsed stack, stats) of each call being run. A
+        # function's stats are kept like those of its body node
+        self.frames = []
+        # time spent in the visits below each running visit
+        self.children = [0.0]
+
+    def visit(self, node, context):
+        entered = not self.frames or context is not self.frames[-1][0]
+        if entered: self.enter(node, context)
+
+        stats = self.stats_for(self.nodes, node_key(node), node, type(node).__name__)
+        stats.active += 1
+        self.children.append(0.0)
+        start = time.perf_counter()
+        try:
+            return Interpreter.visit(self, node, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            own = elapsed - self.children.pop()
+            self.children[-1] += elapsed
+
+            stats.active -= 1
+            stats.hits += 1
+            stats.own += own
+            if not stats.active: stats.total += elapsed
+
+            stack = self.frames[-1][1]
+            self.stacks[stack] = self.stacks.get(stack, 0.0) + own
+            if entered: self.leave(elapsed)
+
+    def stats_for(self, table, key, node, name):
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = NodeStats(node, name)
+        return stats
+
+    # node is the body of the function called, or the whole program
+    def enter(self, node, context):
+        name = context.display_name
+        stack = f'{self.frames[-1][1]};{name}' if self.frames else name
+        stats = self.stats_for(self.functions, (name, node_key(node)), node, name)
+        stats.active += 1
+        self.frames.append((context, stack, stats))
+
+    def leave(self, elapsed):
+        context, stack, stats = self.frames.pop()
+        stats.active -= 1
+        stats.hits += 1
+        if not stats.active: stats.total += elapsed
+
+    # collapsed stacks for flamegraph.pl and the like, self time in microseconds
+    def collapsed(self):
+        return '\n'.join(
+            f'{stack} {round(own * 1e6)}'
+            for stack, own in sorted(self.stacks.items()) if round(own * 1e6) > 0
+        )
+
+    # the limit nodes with the most self time, with their source, then every function
+    def report(self, limit=20):
+        lines = [f'{"hits":>10} {"total ms":>10} {"self ms":>10}  node']
+        for stats in sorted(self.nodes.values(), key=lambda stats: stats.own, reverse=True)[:limit]:
+            node = stats.node
+            pos = node.pos_start
+            lines.append(f'{stats.hits:>10} {stats.total * 1000:>10.3f} {stats.own * 1000:>10.3f}  {stats.name}, File {pos.fn}, line {pos.ln + 1}')
+            lines.append(string_arrows(pos.ftxt, node.pos_start, node.pos_end))
+
+        lines.append(f'{"calls":>10} {"total ms":>10} {"":>10}  function')
+        for stats in sorted(self.functions.values(), key=lambda stats: stats.total, reverse=True):
+            pos = stats.node.pos_start
+            lines.append(f'{stats.hits:>10} {stats.total * 1000:>10.3f} {"":>10}  {stats.name}, File {pos.fn}, line {pos.ln + 1}')
+        return '\n'.join(lines)
+
+# source span of a node, the same for every evaluation of it
+def node_key(node):
+    return (node.pos_start.fn, node.pos_start.idx, node.pos_end.idx, type(node).__name__)
+
+# METRICS
+# what one run did. run() fills in the one it is given, stats=RunStats(),
+# and every run adds its stats to process_metrics. Timings, steps, calls,
+# list copies and allocated bytes are kept by every engine. Nodes, lookups and values
+# made are only counted by the CountingInterpreter, which run() uses for the
+# interpreter engine when it is given stats; the other engines leave them 0
+VALUE_TYPES = ('Num', 'String', 'List', 'Function')
+
+class RunStats:
+    def __init__(self):
+        self.cached = False
+        self.lex_seconds = 0.0
+        self.parse_seconds = 0.0
+        self.execute_seconds = 0.0
+        self.steps = 0
+        self.calls = 0
+        self.list_copies = 0
+        # bytes of Strings and Lists made, see Meter.allocate
+        self.allocated = 0
+        self.nodes = 0
+        self.lookups = 0
+        # parent links followed by those lookups
+        self.lookup_depth = 0
+        self.values = dict.fromkeys(VALUE_TYPES, 0)
+
+    def finish(self, meter, seconds):
+        self.execute_seconds = seconds
+        self.steps = meter.used()
+        self.calls = meter.calls
+        self.list_copies = meter.list_copies
+        self.allocated = meter.allocated
+
+    def add(self, other):
+        for name, value in vars(other).items():
+            if name == 'values':
+                for value_type, count in value.items(): self.values[value_type] += count
+            else:
+                setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self):
+        return dict(vars(self), values=dict(self.values))
+
+    def __repr__(self):
+        return f'<stats nodes={self.nodes} steps={self.steps} calls={self.calls} execute={self.execute_seconds:.6f}s>'
+
+# nodes whose value is made by evaluating them, the others pass one on
+MAKING_NODES = (NumNode, StringNode, ListNode, BinaryOpNode, UnaryOpNode, ForNode, WhileNode, FuncDefNode)
+
+class CountingInterpreter(Interpreter):
+    def __init__(self, stats):
+        self.stats = stats
+
+    def visit(self, node, context):
+        self.stats.nodes += 1
+        res = Interpreter.visit(self, node, context)
+        if type(node) in MAKING_NODES:
+            value_type = type(res.value).__name__
+            if value_type in self.stats.values: self.stats.values[value_type] += 1
+        return res
+
+    def visit_VariableAccessNode(self, node, context):
+        self.stats.lookups += 1
+        self.stats.lookup_depth += lookup_walk(context.symbol_table, node)
+        return Interpreter.visit_VariableAccessNode(self, node, context)
+
+# parent links SymbolTable.lookup follows to find the variable of node
+def lookup_walk(symbol_table, node):
+    if node.depth is not None and symbol_table.lexical:
+        # a resolved address goes straight to its frame, or to the globals
+        return node.depth if node.slot is not None else 0
+
+    name = node.variable_name_tok.value
+    table = symbol_table
+    walked = 0
+    while table.parent:
+        if table.slots is not None and name in table.scope.index:
+            if table.slots[table.scope.index[name]] != None: break
+        elif table.symbols.get(name, None) != None:
+            break
+        table = table.parent
+        walked += 1
+    return walked
+
+# (name, type, help, RunStats attribute) of the per-run numbers process_metrics sums
+METRICS = (
+    ('basic_lex_seconds_total', 'counter', 'Time spent lexing.', 'lex_seconds'),
+    ('basic_parse_seconds_total', 'counter', 'Time spent parsing and annotating trees.', 'parse_seconds'),
+    ('basic_execute_seconds_total', 'counter', 'Time spent running programs.', 'execute_seconds'),
+    ('basic_steps_total', 'counter', 'Loop iterations and calls.', 'steps'),
+    ('basic_calls_total', 'counter', 'Function calls.', 'calls'),
+    ('basic_list_copies_total', 'counter', 'Lists copied to carry a position.', 'list_copies'),
+    ('basic_allocated_bytes_total', 'counter', 'Bytes of Strings and Lists allocated, dropped ones included.', 'allocated'),
+    ('basic_nodes_total', 'counter', 'Nodes evaluated by counting interpreters.', 'nodes'),
+    ('basic_lookups_total', 'counter', 'Variable lookups by counting interpreters.', 'lookups'),
+    ('basic_lookup_depth_total', 'counter', 'Scope links followed by those lookups.', 'lookup_depth'),
+)
+
+# totals of every run in the process, shared by all threads
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.runs = 0
+        self.errors = 0
+        self.totals = RunStats()
+
+    def add(self, stats, error):
+        with self.lock:
+            self.runs += 1
+            if error: self.errors += 1
+            self.totals.add(stats)
+
+    # Prometheus text exposition format
+    def text(self):
+        with self.lock:
+            samples = [
+                ('basic_runs_total', 'counter', 'Programs run.', self.runs),
+                ('basic_run_errors_total', 'counter', 'Programs that ended with an error.', self.errors),
+                ('basic_cached_runs_total', 'counter', 'Programs whose tree came from the cache.', int(self.totals.cached)),
+            ]
+            samples += [(name, kind, help, getattr(self.totals, attribute)) for name, kind, help, attribute in METRICS]
+            values = dict(self.totals.values)
+
+        lines = []
+        for name, kind, help, value in samples:
+            lines += [f'# HELP {name} {help}', f'# TYPE {name} {kind}', f'{name} {value}']
+
+        lines += ['# HELP basic_values_total Values made by counting interpreters, by type.', '# TYPE basic_values_total counter']
+        lines += [f'basic_values_total{{type="{value_type}"}} {count}' for value_type, count in values.items()]
+        return '\n'.join(lines) + '\n'
+
+process_metrics = Metrics()
+
+def metrics_text():
+    return process_metrics.text()
+
 #Run
-globalsymbol_table = SymbolTable()
-globalsymbol_table.set("NULL", Num(0))
-globalsymbol_table.set("FALSE", Num(0))
-globalsymbol_table.set("TRUE", Num(1))
+# names every session starts with
+BUILTINS = {
+    "NULL": Num(0),
+    "FALSE": Num(0),
+    "TRUE": Num(1),
+}
+
+# the globals programs run against. Each session has its own table, so
+# programs in different sessions can run at the same time from different
+# threads. Values are never changed once made, so a fresh table is just a
+# copy of the builtins dict and nothing is shared that a session can change
+class Session:
+    def __init__(self, builtins=BUILTINS):
+        self.symbol_table = SymbolTable()
+        self.symbol_table.symbols.update(builtins)
+
+    def run(self, fn, text, **options):
+        return run(fn, text, session=self, **options)
+
+    # run() for a script run for its side effects: loops whose value would be
+    # the result keep nothing, see discard_result
+    def run_script(self, fn, text, **options):
+        return run(fn, text, session=self, discard_result=True, **options)
+
+    # what the last run used, its allocated is the bytes it allocated in total
+    @property
+    def meter(self):
+        return self.symbol_table.meter
+
+    async def run_async(self, fn, text, **options):
+        return await run_async(fn, text, session=self, **options)
+
+# the session run() uses when none is given, kept by the shell between lines
+default_session = Session()
+globalsymbol_table = default_session.symbol_table
+
+# engines that can execute a parsed program
+ENGINES = ('interpreter', 'vm', 'closure', 'python')
+
+# lexers that turn source into tokens, both give the same tokens and errors
+LEXERS = {
+    'regex': RegexLexer,
+    'scan': Lexer,
+}
+
+# lexed, parsed and annotated tree of a program
+# optimize folds constants with the values of TRUE/FALSE/NULL in constants
+# stats, a RunStats, gets the time spent lexing and parsing
+# discard_result marks the loops whose value would be the program's as discarded
+# memo_names names the MEMO functions defined before, which MEMO bodies may call
+def parse_program(fn, text, short_circuit=False, lexer='regex', optimize=False, constants=None, stats=None, discard_result=False, memo_names=()):
+    if lexer not in LEXERS:
+        raise ValueError(f"Unknown lexer '{lexer}', expected one of {', '.join(LEXERS)}")
 
-def run(fn, text):
     # Generate tokens
-    lexer = Lexer(fn, text)
+    start = time.perf_counter()
+    lexer = LEXERS[lexer](fn, text)
     tokens, error = lexer.make_tokens()
+    lexed = time.perf_counter()
+    if stats: stats.lex_seconds = lexed - start
     if error: return None, error
     
     # Generate AST
     parser = Parser(tokens)
     ast = parser.parse()
+    if stats: stats.parse_seconds = time.perf_counter() - lexed
     if ast.error: return None, ast.error
 
+    node = ast.node
+    if optimize: node = Optimizer(constants).optimize(node)
+    error = memo_error(node, memo_names)
+    if error: return None, error
+
+    # Resolve variable addresses
+    Resolver().resolve(node)
+    mark_loops(node, discard_result)
+    mark_tail_calls(node)
+    if short_circuit: mark_short_circuit(node)
+
+    if stats: stats.parse_seconds = time.perf_counter() - lexed
+    return node, None
+
+
+# trees from parse_program, keyed by a hash of the file name, the source and
+# the options that change the tree. Recently used ones stay in memory; with a
+# directory every tree is also pickled there, like __pycache__. Bump
+# CACHE_FORMAT whenever nodes or the passes change so old files are ignored
+CACHE_FORMAT = 4
+CACHE_SIZE = 256
+
+class ProgramCache:
+    def __init__(self, size=CACHE_SIZE, directory=None):
+        self.size = size
+        self.directory = directory
+        self.programs = OrderedDict()
+        # sessions may share the cache across threads
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # constants is None for a tree that was not optimized
+    def key(self, fn, text, short_circuit, constants=None, discard_result=False, memo_names=()):
+        return hashlib.sha256(repr((CACHE_FORMAT, fn, text, short_circuit, constants, discard_result, memo_names)).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.ast')
+
+    def get(self, key):
+        with self.lock:
+            node = self.programs.get(key)
+            if node is not None:
+                self.hits += 1
+                self.programs.move_to_end(key)
+                return node
+
+        node = self.load(key) if self.directory else None
+        if node is not None:
+            self.disk_hits += 1
+            self.remember(key, node)
+            return node
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def store(self, key, node):
+        self.remember(key, node)
+        if self.directory: self.save(key, node)
+
+    def remember(self, key, node):
+        with self.lock:
+            self.programs[key] = node
+            if len(self.programs) > self.size:
+                self.programs.popitem(last=False)
+
+    # a missing, unreadable or outdated file is a miss
+    def load(self, key):
+        try:
+            with open(self.path(key), 'rb') as file:
+                cache_format, node = pickle.load(file)
+        except Exception:
+            return None
+        return node if cache_format == CACHE_FORMAT else None
+
+    # the disk cache is best effort, a tree too deep to pickle is only kept in memory
+    def save(self, key, node):
+        path = self.path(key)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, 'wb') as file:
+                pickle.dump((CACHE_FORMAT, node), file, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except (OSError, RecursionError, pickle.PicklingError):
+            if os.path.exists(temp_path): os.remove(temp_path)
+
+program_cache = ProgramCache()
+
+# Parse, or take the tree from the cache. An optimized tree depends on the
+# session's current TRUE/FALSE/NULL, and whether MEMO bodies are accepted on
+# the MEMO functions it holds, so they are part of the key
+def load_program(fn, text, short_circuit, lexer, cache, optimize, session, stats, discard_result=False):
+    constants = constant_values(session.symbol_table) if optimize else None
+    memo_names = memo_functions(session.symbol_table)
+    key = cache.key(fn, text, short_circuit, constants, discard_result, memo_names) if cache else None
+    node = cache.get(key) if cache else None
+    stats.cached = node is not None
+
+    if node is None:
+        node, error = parse_program(fn, text, short_circuit, lexer, optimize, constants, stats, discard_result, memo_names)
+        if error: return None, error
+        if cache: cache.store(key, node)
+
+    return node, None
+
+# discard_result runs the program as a statement, for its side effects: a
+# loop whose value would be the result collects nothing and gives an empty
+# List, so a long loop at the top, in an IF branch there or in the body of
+# such a loop no longer keeps every iteration's value. It is off by default
+# because the shell prints that value; Session.run_script turns it on.
+# optimize folds constant expressions before any engine runs, see Optimizer.
+# It is opt-in so a caller's tree is the one it wrote unless it asks
+def run(fn, text, engine='interpreter', short_circuit=False, lexer='regex', cache=program_cache, optimize=False, session=default_session, limits=None, profiler=None, stats=None, discard_result=False):
+    if profiler and engine != 'interpreter':
+        raise ValueError('Only the interpreter can be profiled')
+
+    # the interpreter only counts nodes, lookups and values when asked to
+    counting = stats is not None and engine == 'interpreter' and not profiler
+    if stats is None: stats = RunStats()
+
+    node, error = load_program(fn, text, short_circuit, lexer, cache, optimize, session, stats, discard_result)
+    if error:
+        process_metrics.add(stats, error)
+        return None, error
+
     # Run program
-    interpreter = Interpreter()
     context = Context('<program>')
-    context.symbol_table = globalsymbol_table
-    result = interpreter.visit(ast.node, context)
+    context.symbol_table = session.symbol_table
+    meter = session.symbol_table.meter = Meter(limits)
+    start = time.perf_counter()
+
+    if engine == 'interpreter':
+        interpreter = profiler or (CountingInterpreter(stats) if counting else Interpreter())
+        result = interpreter.visit(node, context)
+    elif engine == 'vm':
+        import vm
+        code = vm.Compiler().compile(node)
+        result = vm.VM().run(code, context)
+    elif engine == 'closure':
+        import closures
+        result = closures.ClosureCompiler().run(node, context)
+    elif engine == 'python':
+        import transpiler
+        result = transpiler.run(node, context)
+    else:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {', '.join(ENGINES)}")
+
+    stats.finish(meter, time.perf_counter() - start)
+    process_metrics.add(stats, result.error)
+    return result.value, result.error
+
+# loop iterations, calls and returns run_async does between giving the event loop a turn
+ASYNC_INTERVAL = 1000
 
+# run() for asyncio. The program runs on the VM, the engine that does not
+# keep its state on the Python stack, and hands control back to the event
+# loop every interval steps, so long scripts share one loop fairly.
+# Cancelling the task stops the script at its next step. Scripts sharing a
+# loop also share their session's globals, give each one its own Session
+async def run_async(fn, text, short_circuit=False, lexer='regex', cache=program_cache, optimize=False, session=default_session, limits=None, stats=None, interval=ASYNC_INTERVAL, discard_result=False):
+    import asyncio
+    import vm
+
+    if stats is None: stats = RunStats()
+    node, error = load_program(fn, text, short_circuit, lexer, cache, optimize, session, stats, discard_result)
+    if error:
+        process_metrics.add(stats, error)
+        return None, error
+
+    context = Context('<program>')
+    context.symbol_table = session.symbol_table
+    meter = session.symbol_table.meter = Meter(limits)
+    start = time.perf_counter()
+
+    steps = vm.VM().steps(vm.Compiler().compile(node), context, interval)
+    try:
+        while True:
+            try:
+                next(steps)
+            except StopIteration as stop:
+                result = stop.value
+                break
+            await asyncio.sleep(0)
+    finally:
+        steps.close()
+
+    # the time the script had the event loop and the time it waited for it
+    stats.finish(meter, time.perf_counter() - start)
+    process_metrics.add(stats, result.error)
     return result.value, result.error
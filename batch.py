@@ -0,0 +1,112 @@
+# Runs many script files across a pool of worker processes and writes one
+# JSON line per file to stdout, the totals go to stderr.
+#
+#   python batch.py [-j JOBS] [--engine ENGINE] [--pattern GLOB] [--unordered]
+#                   [--keep-results] PATH ...
+#
+# A directory stands for every file under it matching --pattern. Workers
+# read and parse the files themselves and each file runs in a session of
+# its own, so results do not depend on which worker ran what. Files go to
+# the workers in chunks to keep the per-file overhead low. Files run as
+# scripts (Session.run_script): a loop at the top keeps none of its values
+# and comes back as [], unless --keep-results is given.
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import repeat
+
+import basic
+
+# files per chunk handed to a worker, at most
+MAX_CHUNK = 64
+
+
+def run_file(path, engine, keep_results):
+    result = {'file': path, 'ok': False, 'value': None, 'error': None}
+    start = time.perf_counter()
+    try:
+        with open(path, encoding='utf-8') as file:
+            text = file.read()
+        # every file is run once, keeping its tree would only cost memory
+        session = basic.Session()
+        run = session.run if keep_results else session.run_script
+        value, error = run(path, text, engine=engine, cache=None)
+        result['ok'] = error is None
+        result['value'] = None if value is None else repr(value)
+        result['error'] = error.as_string() if error else None
+    except Exception as exception:
+        # a crashing script must not take the worker and its chunk down
+        result['error'] = f'{type(exception).__name__}: {exception}'
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def run_chunk(paths, engine, keep_results):
+    return [run_file(path, engine, keep_results) for path in paths]
+
+
+def find_files(paths, pattern):
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for directory, subdirectories, names in os.walk(path):
+            subdirectories.sort()
+            files += [os.path.join(directory, name) for name in sorted(names) if fnmatch.fnmatch(name, pattern)]
+    return files
+
+
+def chunked(files, jobs):
+    size = max(1, min(MAX_CHUNK, len(files) // (jobs * 4)))
+    return [files[i:i + size] for i in range(0, len(files), size)]
+
+
+# chunk results as the workers finish them, in file order unless ordered is False
+def results(chunks, jobs, engine, keep_results, ordered):
+    if jobs == 1:
+        yield from map(run_chunk, chunks, repeat(engine), repeat(keep_results))
+        return
+
+    with ProcessPoolExecutor(jobs) as executor:
+        if ordered:
+            yield from executor.map(run_chunk, chunks, repeat(engine), repeat(keep_results))
+        else:
+            futures = [executor.submit(run_chunk, chunk, engine, keep_results) for chunk in chunks]
+            for future in as_completed(futures):
+                yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run script files in parallel, one JSON line per file.')
+    parser.add_argument('paths', nargs='+', help='script files or directories')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='worker processes (default: one per CPU)')
+    parser.add_argument('--engine', default='interpreter', choices=basic.ENGINES)
+    parser.add_argument('--pattern', default='*', help='file name pattern inside directories (default: *)')
+    parser.add_argument('--unordered', action='store_true', help='write results as they complete instead of in file order')
+    parser.add_argument('--keep-results', action='store_true', help='keep the values of loops at the top of a file for its result')
+    args = parser.parse_args(argv)
+
+    files = find_files(args.paths, args.pattern)
+    jobs = max(1, args.jobs)
+    failed = 0
+    start = time.perf_counter()
+
+    for chunk in results(chunked(files, jobs), jobs, args.engine, args.keep_results, not args.unordered):
+        for result in chunk:
+            if not result['ok']: failed += 1
+            sys.stdout.write(json.dumps(result) + '\n')
+        sys.stdout.flush()
+
+    elapsed = time.perf_counter() - start
+    rate = len(files) / elapsed if elapsed else 0
+    print(f'{len(files)} files, {failed} failed, {elapsed:.2f}s, {rate:.1f} files/s with {jobs} jobs', file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,42 @@
+# Arithmetic-heavy loops, time per iteration for each engine.
+#
+#   python -m benchmarks.arith [iterations]
+#
+# Num-Num operations take the fast path: no copies, no set_pos/set_context,
+# and results in the small-int range come from a shared cache. Operations on
+# literals and IF TRUE are folded away before any engine runs, the programs
+# run with optimize on.
+import sys
+import time
+
+import basic
+
+ITERATIONS = 10 ** 6
+
+PROGRAMS = {
+    'square': 'FOR i = 0 TO {n} DO i * i',
+    'counter': 'WHILE c < {n} DO VARIABLE c = c + 1',
+    'mixed': 'FOR i = 0 TO {n} DO (i + 1) * 2 - i / 4 == 3',
+    'literals': 'FOR i = 0 TO {n} DO IF TRUE DO i + 2 ^ 10 * 3 ELSE 0',
+}
+
+
+def time_run(source, engine):
+    basic.globalsymbol_table.set('c', basic.Num(0))
+    start = time.perf_counter()
+    value, error = basic.run('<bench>', source, engine, optimize=True)
+    elapsed = time.perf_counter() - start
+    if error: raise Exception(error.as_string())
+    return elapsed
+
+
+def main(n):
+    print(f'{n} iterations, ns/iter')
+    print(f'{"program":>10}' + ''.join(f'{engine:>13}' for engine in basic.ENGINES))
+    for name, source in PROGRAMS.items():
+        row = [time_run(source.format(n=n), engine) / n * 1e9 for engine in basic.ENGINES]
+        print(f'{name:>10}' + ''.join(f'{ns:>13.0f}' for ns in row))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ITERATIONS)
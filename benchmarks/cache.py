@@ -0,0 +1,51 @@
+# Latency of run() with a cold program cache, a warm in-memory cache and a
+# warm disk cache (fresh process memory, trees loaded from the directory).
+#
+#   python -m benchmarks.cache [repeats]
+import sys
+import tempfile
+import time
+
+import basic
+from benchmarks.memory import source
+
+REPEATS = 20
+
+PROGRAMS = {
+    'small': 'FUN fib(n) -> IF n < 2 DO n ELSE fib(n - 1) + fib(n - 2)',
+    'large': source(64),
+}
+
+
+def time_runs(text, cache, repeats):
+    start = time.perf_counter()
+    for i in range(repeats):
+        value, error = basic.run('<bench>', text, cache=cache)
+        if error: raise Exception(error.as_string())
+    return (time.perf_counter() - start) / repeats
+
+
+def main(repeats):
+    print(f'ms per run() over {repeats} runs')
+    print(f'{"program":>8} {"cold":>10} {"memory":>10} {"disk":>10}')
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, text in PROGRAMS.items():
+            cold = time_runs(text, None, repeats)
+
+            memory = basic.ProgramCache()
+            time_runs(text, memory, 1)
+            warm = time_runs(text, memory, repeats)
+
+            # every run gets an empty in-memory cache, so it reads the pickle
+            basic.run('<bench>', text, cache=basic.ProgramCache(directory=directory))
+            start = time.perf_counter()
+            for i in range(repeats):
+                time_runs(text, basic.ProgramCache(directory=directory), 1)
+            disk = (time.perf_counter() - start) / repeats
+
+            print(f'{name:>8} {cold * 1e3:>10.2f} {warm * 1e3:>10.2f} {disk * 1e3:>10.2f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else REPEATS)
@@ -0,0 +1,197 @@
+# Random valid programs of a target size and shape, following grammar.txt.
+#
+#   python -m benchmarks.generate SHAPE KILOBYTES [--depth N] [--seed N] > program.txt
+#
+# mixed:  random expressions drawing on every rule of the grammar
+# deep:   parenthesised arithmetic nested depth levels
+# chain:  one long ADDITIONALLY / ALTERNATIVELY chain of comparisons
+# wide:   a single list literal with as many elements as fit
+# nested: FUN and IF bodies nested depth levels
+#
+# A program is made of units of the shape joined by ALTERNATIVELY until it
+# reaches the size. The parser reads such chains (and list elements) in a
+# loop, so size is unbounded while the depth of a unit stays within what the
+# recursive descent parser can take.
+import argparse
+import random
+import sys
+
+SHAPES = ('mixed', 'deep', 'chain', 'wide', 'nested')
+DEPTH = 40
+# nesting of the rule-by-rule expressions of the mixed shape, each level
+# multiplies their size
+MIXED_DEPTH = 4
+
+NAMES = ('a', 'b', 'x', 'y1', 'count', 'f_2')
+COMPARISONS = ('==', '!=', '<', '>', '<=', '>=')
+
+
+class Generator:
+    def __init__(self, seed=0, depth=DEPTH):
+        self.random = random.Random(seed)
+        self.depth = depth
+
+    def program(self, shape, size):
+        if shape not in SHAPES:
+            raise ValueError(f"Unknown shape '{shape}', expected one of {', '.join(SHAPES)}")
+        if shape == 'wide': return self.wide(size)
+
+        unit = getattr(self, f'{shape}_unit')
+        join = ' ALTERNATIVELY ' if shape != 'chain' else None
+        parts = []
+        length = 0
+        while length < size:
+            if parts:
+                parts.append(join or self.random.choice((' ADDITIONALLY ', ' ALTERNATIVELY ')))
+                length += len(parts[-1])
+            parts.append(unit())
+            length += len(parts[-1])
+        return ''.join(parts)
+
+    # units
+    def mixed_unit(self):
+        return f'({self.expr(MIXED_DEPTH)})'
+
+    def deep_unit(self):
+        text = self.atom()
+        for _ in range(self.depth):
+            text = f'({text} {self.random.choice("+-*/")} {self.atom()})'
+        return text
+
+    def chain_unit(self):
+        return self.comparison()
+
+    def nested_unit(self):
+        text = self.atom()
+        for level in range(self.depth):
+            if level % 2:
+                text = f'(FUN f{level}(a, b) -> {text})'
+            else:
+                text = f'(IF a < {level} DO {text} ELSE b)'
+        return text
+
+    def wide(self, size):
+        parts = ['[']
+        length = 2
+        while length < size:
+            if len(parts) > 1:
+                parts.append(', ')
+                length += 2
+            parts.append(self.atom())
+            length += len(parts[-1])
+        parts.append(']')
+        return ''.join(parts)
+
+    # rules of grammar.txt, depth bounds how far fragment may recurse
+    # expr : KEYWORD:VARIABLE IDENTIFIER EQUALS expr
+    #      : comp-expr((KEYWORD:ADDITIONALLY|KEYWORD:ALTERNATIVELY) comp-expr)*
+    def expr(self, depth):
+        if self.random.random() < 0.15:
+            return f'VARIABLE {self.name()} = {self.expr(depth)}'
+        return self.repeat(self.comp_expr, depth, (' ADDITIONALLY ', ' ALTERNATIVELY '))
+
+    def comp_expr(self, depth):
+        if self.random.random() < 0.1:
+            return f'NOT {self.comp_expr(depth)}'
+        return self.repeat(self.math_expr, depth, [f' {op} ' for op in COMPARISONS])
+
+    def math_expr(self, depth):
+        return self.repeat(self.term, depth, (' + ', ' - '))
+
+    def term(self, depth):
+        return self.repeat(self.factor, depth, (' * ', ' / '))
+
+    def factor(self, depth):
+        if self.random.random() < 0.1:
+            return f'{self.random.choice("+-")}{self.factor(depth)}'
+        return self.repeat(self.call, depth, (' ^ ',))
+
+    def call(self, depth):
+        fragment = self.fragment(depth)
+        if self.random.random() < 0.1:
+            args = [self.expr(depth - 1) for _ in range(self.random.randint(0, 2))] if depth > 0 else []
+            return f'{fragment}({", ".join(args)})'
+        return fragment
+
+    def fragment(self, depth):
+        if depth <= 0 or self.random.random() < 0.7:
+            return self.atom()
+        rule = self.random.choice((self.parenthesised, self.list_expr, self.if_expr, self.for_expr, self.while_expr, self.func_def))
+        return rule(depth - 1)
+
+    def parenthesised(self, depth):
+        return f'({self.expr(depth)})'
+
+    def list_expr(self, depth):
+        return f'[{", ".join(self.expr(depth) for _ in range(self.random.randint(0, 3)))}]'
+
+    def if_expr(self, depth):
+        text = f'IF {self.expr(depth)} DO {self.expr(depth)}'
+        for _ in range(self.random.randint(0, 2)):
+            text += f' ORIF {self.expr(depth)} DO {self.expr(depth)}'
+        if self.random.random() < 0.7:
+            text += f' ELSE {self.expr(depth)}'
+        return text
+
+    def for_expr(self, depth):
+        step = f' STEP {self.expr(depth)}' if self.random.random() < 0.3 else ''
+        return f'FOR {self.name()} = {self.expr(depth)} TO {self.expr(depth)}{step} DO {self.expr(depth)}'
+
+    def while_expr(self, depth):
+        return f'WHILE {self.expr(depth)} DO {self.expr(depth)}'
+
+    def func_def(self, depth):
+        name = f' {self.name()}' if self.random.random() < 0.7 else ''
+        arg_names = self.random.sample(NAMES, self.random.randint(0, 3))
+        args = ', '.join(arg_names)
+        if self.random.random() < 0.2:
+            # a MEMO body may not assign and only reads its arguments, arithmetic
+            # on those and literals does neither. The parentheses keep whatever
+            # follows from joining the body
+            term = lambda depth: f'{self.memo_atom(arg_names)} * {self.memo_atom(arg_names)}'
+            return f'(FUN MEMO {self.random.randint(1, 64)}{name}({args}) -> {self.repeat(term, depth, (" + ", " - "))})'
+        return f'FUN{name}({args}) -> {self.expr(depth)}'
+
+    # helpers
+    def repeat(self, rule, depth, operators):
+        text = rule(depth)
+        for _ in range(self.random.choice((0, 0, 0, 0, 1))):
+            text += self.random.choice(operators) + rule(depth)
+        return text
+
+    def memo_atom(self, arg_names):
+        atom = self.atom()
+        if atom in NAMES: return self.random.choice(arg_names) if arg_names else '1'
+        return atom
+
+    def comparison(self):
+        return f'{self.atom()} {self.random.choice(COMPARISONS)} {self.atom()}'
+
+    def name(self):
+        return self.random.choice(NAMES)
+
+    def atom(self):
+        kind = self.random.randrange(4)
+        if kind == 0: return str(self.random.randint(0, 1000))
+        if kind == 1: return f'{self.random.randint(0, 100)}.{self.random.randint(0, 99)}'
+        if kind == 2: return f'"{self.random.choice(NAMES)}"'
+        return self.name()
+
+
+def generate(shape, size, depth=DEPTH, seed=0):
+    return Generator(seed, depth).program(shape, size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a random valid program of the given shape and size.')
+    parser.add_argument('shape', choices=SHAPES)
+    parser.add_argument('kilobytes', type=float)
+    parser.add_argument('--depth', type=int, default=DEPTH, help=f'nesting of the deep and nested shapes (default: {DEPTH})')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    sys.stdout.write(generate(args.shape, int(args.kilobytes * 1024), args.depth, args.seed) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# Guard-heavy loops with and without short-circuit evaluation.
+#
+#   python -m benchmarks.guards [iterations]
+#
+# Every guard is decided by its left operand, so with short_circuit=True
+# the call to slow() on the right never runs.
+import sys
+import time
+
+import basic
+
+ITERATIONS = 2000
+
+SETUP = 'FUN slow(n) -> IF n > 0 DO slow(n - 1) ELSE 1'
+
+PROGRAMS = {
+    'additionally': 'FOR i = 0 TO {n} DO i < 0 ADDITIONALLY slow(20)',
+    'alternatively': 'FOR i = 0 TO {n} DO i >= 0 ALTERNATIVELY slow(20)',
+    'nested': 'FOR i = 0 TO {n} DO (i == -1 ADDITIONALLY slow(20)) ALTERNATIVELY i >= 0',
+}
+
+
+def time_run(source, engine, short_circuit):
+    value, error = basic.run('<bench>', SETUP)
+    if error: raise Exception(error.as_string())
+
+    start = time.perf_counter()
+    value, error = basic.run('<bench>', source, engine, short_circuit)
+    elapsed = time.perf_counter() - start
+    if error: raise Exception(error.as_string())
+    return elapsed
+
+
+def main(n):
+    modes = [(engine, short_circuit) for engine in basic.ENGINES for short_circuit in (False, True)]
+
+    print(f'{n} iterations, us/iter')
+    print(f'{"program":>14}' + ''.join(f'{engine + (" sc" if sc else ""):>16}' for engine, sc in modes))
+    for name, source in PROGRAMS.items():
+        row = [time_run(source.format(n=n), engine, sc) / n * 1e6 for engine, sc in modes]
+        print(f'{name:>14}' + ''.join(f'{us:>16.1f}' for us in row))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ITERATIONS)
@@ -0,0 +1,41 @@
+# Lexing time of the character loop against the regex scanner.
+#
+#   python -m benchmarks.lexer [kilobytes ...]
+#
+# The source is one long line of mixed numbers, strings, keywords and
+# operators, repeated to the requested size.
+import sys
+import time
+
+import basic
+
+SIZES = (64, 256, 1024)
+
+CHUNK = 'FUN f_1(a, b) -> IF a >= 10 ADDITIONALLY b != 2.5 DO "text" ELSE [a * b, a ^ 2, -b / 4] + '
+
+
+def source(kilobytes):
+    return CHUNK * (kilobytes * 1024 // len(CHUNK)) + '0'
+
+
+def time_lexer(name, text):
+    start = time.perf_counter()
+    tokens, error = basic.LEXERS[name]('<bench>', text).make_tokens()
+    elapsed = time.perf_counter() - start
+    if error: raise Exception(error.as_string())
+    return elapsed, len(tokens)
+
+
+def main(sizes):
+    print(f'{"KB":>6} {"tokens":>9}' + ''.join(f'{name + " s":>10}' for name in basic.LEXERS))
+    for kilobytes in sizes:
+        text = source(kilobytes)
+        times = []
+        for name in basic.LEXERS:
+            elapsed, count = time_lexer(name, text)
+            times.append(elapsed)
+        print(f'{kilobytes:>6} {count:>9}' + ''.join(f'{elapsed:>10.3f}' for elapsed in times))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,111 @@
+# List building, indexing, removal and concatenation.
+#
+#   python -m benchmarks.lists [size ...]
+#
+# Storage level: PVector against copying a Python list per operation (the
+# previous List behaviour, only timed while it finishes in reasonable time).
+# Script level: `VARIABLE l = l + i` in a FOR loop through basic.run.
+import random
+import sys
+import time
+
+import basic
+from pvector import PVector
+
+SIZES = (10 ** 5, 10 ** 6)
+COPYING_LIMIT = 2 * 10 ** 4
+SCRIPT_LIMIT = 10 ** 5
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def pvector_ops(n):
+    vector = PVector()
+    def build():
+        nonlocal vector
+        for i in range(n):
+            vector = vector.append(i)
+
+    picks = [random.randrange(n) for _ in range(10000)]
+    def index():
+        for i in picks:
+            vector[i]
+
+    def delete():
+        for i in picks[:1000]:
+            vector.delete(i)
+
+    def concat():
+        for _ in range(1000):
+            vector.concat(vector)
+
+    return {
+        'append': timed(build) / n,
+        'index': timed(index) / len(picks),
+        'delete': timed(delete) / 1000,
+        'concat': timed(concat) / 1000,
+    }
+
+
+def copying_ops(n):
+    elements = []
+    def build():
+        nonlocal elements
+        for i in range(n):
+            elements = elements[:]
+            elements.append(i)
+
+    def delete():
+        for i in range(100):
+            copy = elements[:]
+            copy.pop(i)
+
+    def concat():
+        for _ in range(100):
+            copy = elements[:]
+            copy.extend(elements)
+
+    return {
+        'append': timed(build) / n,
+        'index': None,
+        'delete': timed(delete) / 100,
+        'concat': timed(concat) / 100,
+    }
+
+
+def script(n):
+    basic.run('<bench>', 'VARIABLE l = []')
+    build = timed(lambda: basic.run('<bench>', f'FOR i = 0 TO {n} DO VARIABLE l = l + i'))
+    reads = timed(lambda: basic.run('<bench>', f'FOR i = 0 TO {n} STEP {max(n // 1000, 1)} DO l / i'))
+    concat = timed(lambda: basic.run('<bench>', 'l * l'))
+    return build, reads, concat
+
+
+def us(seconds):
+    return '-' if seconds is None else f'{seconds * 1e6:.2f}'
+
+
+def main(sizes):
+    print('per operation, microseconds')
+    print(f'{"size":>9} {"storage":>9} {"append":>9} {"index":>9} {"delete":>9} {"concat":>9}')
+    for n in sizes:
+        rows = [('pvector', pvector_ops(n))]
+        if n <= COPYING_LIMIT: rows.append(('copying', copying_ops(n)))
+        for name, ops in rows:
+            print(f'{n:>9} {name:>9} {us(ops["append"]):>9} {us(ops["index"]):>9} {us(ops["delete"]):>9} {us(ops["concat"]):>9}')
+
+    print()
+    print('basic.run, seconds')
+    print(f'{"size":>9} {"build":>9} {"reads":>9} {"concat":>9}')
+    for n in sizes:
+        if n > SCRIPT_LIMIT: continue
+        build, reads, concat = script(n)
+        print(f'{n:>9} {build:>9.3f} {reads:>9.3f} {concat:>9.3f}')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
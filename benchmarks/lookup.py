@@ -0,0 +1,63 @@
+# Variable lookup cost against FUN nesting depth.
+#
+#   python -m benchmarks.lookup
+#
+# The innermost body reads a global and the outermost argument four times
+# each per iteration. With resolved (depth, slot) addresses the cost should stay flat,
+# the plain SymbolTable.get chain grows with every level.
+import sys
+import time
+
+from basic import *
+
+ITERATIONS = 20000
+DEPTHS = (1, 2, 4, 8, 16, 32)
+
+
+def nested_source(depth):
+    body = f'FOR i = 0 TO {ITERATIONS} DO g + g + g + g + a0 + a0 + a0 + a0'
+    for level in reversed(range(1, depth)):
+        body = f'(FUN (a{level}) -> {body})({level})'
+    return f'FUN f(a0) -> {body}'
+
+
+def parse(source):
+    tokens, error = Lexer('<bench>', source).make_tokens()
+    if error: raise Exception(error.as_string())
+    ast = Parser(tokens).parse()
+    if ast.error: raise Exception(ast.error.as_string())
+    return ast.node
+
+
+def time_call(func_node, resolve):
+    if resolve: Resolver().resolve(func_node)
+
+    context = Context('<program>')
+    context.symbol_table = SymbolTable()
+    context.symbol_table.set('g', Num(1))
+
+    interpreter = Interpreter()
+    interpreter.visit(func_node, context)
+
+    call_node = parse('f(1)')
+    if resolve: Resolver().resolve(call_node)
+
+    start = time.perf_counter()
+    result = interpreter.visit(call_node, context)
+    elapsed = time.perf_counter() - start
+    if result.error: raise Exception(result.error.as_string())
+    return elapsed
+
+
+def main():
+    print(f'{"depth":>6} {"dynamic us/iter":>16} {"resolved us/iter":>17}')
+    for depth in DEPTHS:
+        source = nested_source(depth)
+        dynamic = time_call(parse(source), False)
+        resolved = time_call(parse(source), True)
+        print(f'{depth:>6} {dynamic / ITERATIONS * 1e6:>16.2f} {resolved / ITERATIONS * 1e6:>17.2f}')
+
+
+if __name__ == '__main__':
+    sys.setrecursionlimit(10000)
+    main()
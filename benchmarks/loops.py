@@ -0,0 +1,71 @@
+# Peak memory of FOR/WHILE results against the iteration count, then the
+# time of a numeric FOR and of a WHILE that assigns on every engine.
+#
+#   python -m benchmarks.loops [iterations ...]
+#
+# lazy:      pure FOR body, elements are recomputed on demand
+# discarded: loop used as an IF condition, nothing is collected
+# collected: body assigns a variable, every element is kept
+# statement: the collected loop run with discard_result, nothing is kept
+#
+# for:   numeric FOR body, the python engine keeps i a raw number
+# while: WHILE condition and assignment, every step looks up and binds c
+import sys
+import time
+import tracemalloc
+
+import basic
+
+ITERATIONS = (10 ** 4, 10 ** 5, 10 ** 6)
+
+# name: (program, run options)
+PROGRAMS = {
+    'lazy': ('FOR i = 0 TO {n} DO i * i', {}),
+    'discarded': ('IF FOR i = 0 TO {n} DO FOR j = 0 TO 1 DO i DO 1 ELSE 0', {}),
+    'collected': ('FOR i = 0 TO {n} DO VARIABLE last = i * i', {}),
+    'statement': ('FOR i = 0 TO {n} DO VARIABLE last = i * i', {'discard_result': True}),
+}
+
+# name: (setup, program)
+TIMED = {
+    'for': ('VARIABLE c = 0', 'FOR i = 0 TO {n} DO i * i'),
+    'while': ('VARIABLE c = 0', 'WHILE c < {n} DO VARIABLE c = c + 1'),
+}
+
+
+def peak_kb(source, options):
+    tracemalloc.start()
+    value, error = basic.run('<bench>', source, **options)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if error: raise Exception(error.as_string())
+    return peak // 1024
+
+
+def seconds(setup, source, engine):
+    session = basic.Session()
+    session.run('<bench>', setup, engine=engine)
+    start = time.perf_counter()
+    value, error = session.run_script('<bench>', source, engine=engine)
+    elapsed = time.perf_counter() - start
+    if error: raise Exception(error.as_string())
+    return elapsed
+
+
+def main(iterations):
+    print('peak KB')
+    print(f'{"iterations":>11}' + ''.join(f'{name:>11}' for name in PROGRAMS))
+    for n in iterations:
+        row = [peak_kb(source.format(n=n), options) for source, options in PROGRAMS.values()]
+        print(f'{n:>11}' + ''.join(f'{kb:>11}' for kb in row))
+
+    n = max(iterations)
+    print(f'\nseconds, {n} iterations')
+    print(f'{"program":>11}' + ''.join(f'{engine:>13}' for engine in basic.ENGINES))
+    for name, (setup, source) in TIMED.items():
+        row = [seconds(setup, source.format(n=n), engine) for engine in basic.ENGINES]
+        print(f'{name:>11}' + ''.join(f'{s:>13.2f}' for s in row))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or ITERATIONS)
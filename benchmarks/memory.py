@@ -0,0 +1,47 @@
+# Memory held by the token list and by the parsed AST, per token.
+#
+#   python -m benchmarks.memory [kilobytes]
+#
+# Sizes are what tracemalloc sees allocated while the structure is alive, so
+# they include positions, token values and node attributes. The source is one
+# flat list literal so the parser does not recurse once per element.
+import sys
+import tracemalloc
+
+import basic
+
+KILOBYTES = 256
+
+ELEMENT = '(FUN f_1(a, b) -> IF a >= 10 ADDITIONALLY b != 2.5 DO "text" ELSE [a * b, a ^ 2, -b / 4])'
+
+
+def source(kilobytes):
+    return '[' + ', '.join([ELEMENT] * (kilobytes * 1024 // (len(ELEMENT) + 2))) + ']'
+
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def main(kilobytes):
+    text = source(kilobytes)
+    print(f'{kilobytes} KB source, {len(text)} characters')
+    print(f'{"lexer":>8} {"tokens":>9} {"token B/tok":>12} {"ast B/tok":>10}')
+
+    for name, lexer in basic.LEXERS.items():
+        (tokens, error), token_bytes = measure(lambda: lexer('<bench>', text).make_tokens())
+        if error: raise Exception(error.as_string())
+
+        ast, ast_bytes = measure(lambda: basic.Parser(tokens).parse())
+        if ast.error: raise Exception(ast.error.as_string())
+
+        print(f'{name:>8} {len(tokens):>9} {token_bytes / len(tokens):>12.0f} {ast_bytes / len(tokens):>10.0f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else KILOBYTES)
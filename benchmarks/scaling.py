@@ -0,0 +1,174 @@
+# Lexer and Parser throughput against program size and nesting depth.
+#
+#   python -m benchmarks.scaling [--shape SHAPE ...] [--lexer NAME] [--depth N]
+#                                [--depths N ...] [--no-memory] [kilobytes ...]
+#
+# Programs come from benchmarks.generate. For every shape and size the source
+# is lexed with Lexer.make_tokens and parsed with Parser.parse, reporting
+# tokens/s, nodes/s and the peak traced memory of each step (a second,
+# tracemalloc run, so it does not slow the timed one). Between neighbouring
+# sizes the growth exponent log(time ratio) / log(size ratio) is worked out;
+# above 1 + TOLERANCE the step is flagged as super-linear. The depth table
+# does the same for the deep and nested shapes at a fixed size and growing
+# depth, where the time should not grow at all.
+# Sizes up to 100 MB (102400) work, given memory for the tokens: about a
+# gigabyte for every 10 MB of source.
+import argparse
+import math
+import sys
+import time
+import tracemalloc
+
+import basic
+from benchmarks.generate import DEPTH, SHAPES, generate
+
+SIZES = (1, 10, 100, 1000)
+DEPTHS = (10, 20, 40, 80)
+DEPTH_SIZE = 100
+TOLERANCE = 0.2
+# every input is timed MIN_RUNS times, small ones again until they took
+# MIN_SECONDS, and the best run counts
+MIN_RUNS = 3
+MIN_SECONDS = 0.2
+MAX_RUNS = 50
+# steps faster than this run from warm caches and are not compared
+MIN_COMPARED = 0.01
+
+
+def best_time(func):
+    start = time.perf_counter()
+    result = func()
+    best = total = time.perf_counter() - start
+    runs = 1
+    while runs < MIN_RUNS or (total < MIN_SECONDS and runs < MAX_RUNS):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        total += elapsed
+        runs += 1
+    return best, result
+
+
+def peak_bytes(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# iteratively, a long operator chain parses into a tree deeper than the recursion limit
+def count_nodes(node):
+    count = 0
+    stack = [node]
+    while stack:
+        count += 1
+        stack += basic.child_nodes(stack.pop())
+    return count
+
+
+def measure(text, lexer, memory):
+    def lex():
+        tokens, error = basic.LEXERS[lexer]('<bench>', text).make_tokens()
+        if error: raise Exception(error.as_string())
+        return tokens
+
+    lex_seconds, tokens = best_time(lex)
+
+    def parse():
+        ast = basic.Parser(tokens).parse()
+        if ast.error: raise Exception(ast.error.as_string())
+        return ast.node
+
+    parse_seconds, node = best_time(parse)
+    row = {
+        'bytes': len(text),
+        'tokens': len(tokens),
+        'nodes': count_nodes(node),
+        'lex': lex_seconds,
+        'parse': parse_seconds,
+        'lex_peak': None,
+        'parse_peak': None,
+    }
+    del node
+    if memory:
+        row['lex_peak'] = peak_bytes(lex)
+        row['parse_peak'] = peak_bytes(parse)
+    return row
+
+
+# growth exponents of the steps from previous to row, whose variable grew
+# scale times, with a flag for each super-linear one
+def growth(previous, row, scale, variable='n'):
+    flags = []
+    for step in ('lex', 'parse'):
+        if previous[step] < MIN_COMPARED: continue
+        exponent = math.log(row[step] / previous[step]) / math.log(scale)
+        flags.append(f'{step} {variable}^{exponent:.2f}' + (' SUPER-LINEAR' if exponent > 1 + TOLERANCE else ''))
+    return ', '.join(flags)
+
+
+def mb(peak):
+    return '-' if peak is None else f'{peak / 2 ** 20:.1f}'
+
+
+def print_header(first):
+    print(f'{first:>8} {"KB":>8} {"tokens":>10} {"lex s":>9} {"tokens/s":>10} {"parse s":>9} {"nodes/s":>10} {"lex MB":>8} {"parse MB":>8}  growth')
+
+
+def print_row(label, row, flags):
+    print(
+        f'{label:>8} {row["bytes"] / 1024:>8.0f} {row["tokens"]:>10} '
+        f'{row["lex"]:>9.4f} {row["tokens"] / row["lex"]:>10.0f} '
+        f'{row["parse"]:>9.4f} {row["nodes"] / row["parse"]:>10.0f} '
+        f'{mb(row["lex_peak"]):>8} {mb(row["parse_peak"]):>8}  {flags}'
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Lexer and Parser scaling with program size and nesting depth.')
+    parser.add_argument('kilobytes', type=int, nargs='*', help=f'program sizes (default: {" ".join(map(str, SIZES))})')
+    parser.add_argument('--shape', action='append', choices=SHAPES, help='program shape, repeatable (default: all)')
+    parser.add_argument('--lexer', default='regex', choices=list(basic.LEXERS))
+    parser.add_argument('--depth', type=int, default=DEPTH, help=f'nesting of the deep and nested shapes (default: {DEPTH})')
+    parser.add_argument('--depths', type=int, nargs='*', default=DEPTHS, help='depths for the depth table, none to skip it')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc runs')
+    args = parser.parse_args(argv)
+
+    sizes = sorted(args.kilobytes or SIZES)
+    shapes = args.shape or SHAPES
+    memory = not args.no_memory
+
+    print(f'{args.lexer} lexer, by size')
+    print_header('shape')
+    for shape in shapes:
+        previous = None
+        for kilobytes in sizes:
+            row = measure(generate(shape, kilobytes * 1024, args.depth, args.seed), args.lexer, memory)
+            flags = growth(previous, row, row['bytes'] / previous['bytes']) if previous else ''
+            print_row(shape, row, flags)
+            previous = row
+
+    if not args.depths: return
+
+    print()
+    print(f'{args.lexer} lexer, by depth at {DEPTH_SIZE} KB')
+    print_header('depth')
+    for shape in ('deep', 'nested'):
+        if shape not in shapes: continue
+        previous = None
+        for depth in sorted(args.depths):
+            row = measure(generate(shape, DEPTH_SIZE * 1024, depth, args.seed), args.lexer, memory)
+            # the same size at any depth, so time should not grow with it at all
+            flags = growth(previous, row, depth / previous_depth, 'd') if previous else ''
+            print_row(f'{shape} {depth}', row, flags)
+            previous, previous_depth = row, depth
+
+
+if __name__ == '__main__':
+    # deep shapes recurse through every grammar rule per level
+    sys.setrecursionlimit(10000)
+    main()
@@ -0,0 +1,150 @@
+# Canonical workloads timed under basic.run, with a baseline to compare against.
+#
+#   python -m benchmarks.suite [--engine ENGINE ...] [--workload NAME ...]
+#                              [--warmup N] [--repeat N] [--output FILE]
+#                              [--baseline FILE] [--threshold FRACTION]
+#
+# Every repetition runs in a fresh Session: the setup program (definitions,
+# initial variables) first, untimed, then the timed program. Warmup runs fill
+# the program cache, so the timings are of execution. --output writes the
+# summaries as JSON; --baseline compares the medians with such a file and
+# the exit status is 1 when a workload got slower by more than --threshold.
+# Runs with optimize on fold constant expressions, so an operand a workload
+# is meant to work on comes from its setup program; main refuses workloads
+# that would fold away.
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+import basic
+
+# name: (setup program or None, timed program)
+WORKLOADS = {
+    'fib': ('FUN fib(n) -> IF n < 2 DO n ELSE fib(n - 1) + fib(n - 2)', 'fib(16)'),
+    'nested_for': (None, 'FOR i = 0 TO 120 DO FOR j = 0 TO 120 DO i * j + i - j'),
+    'while_counter': ('VARIABLE c = 0', 'WHILE c < 15000 DO VARIABLE c = c + 1'),
+    'list_append': ('VARIABLE l = []', 'FOR i = 0 TO 15000 DO VARIABLE l = l + i'),
+    'list_concat': ('VARIABLE l = []', 'FOR i = 0 TO 5000 DO VARIABLE l = l * [i, i]'),
+    'string_repeat': ('VARIABLE n = 64', 'FOR i = 0 TO 15000 DO "ab" * n'),
+    'call_chain': ('FUN down(n) -> IF n == 0 DO 0 ELSE down(n - 1) + 1', 'FOR i = 0 TO 40 DO down(300)'),
+}
+
+WARMUP = 1
+REPEAT = 5
+THRESHOLD = 0.10
+
+
+def time_workload(name, engine):
+    setup, source = WORKLOADS[name]
+    session = basic.Session()
+    if setup:
+        value, error = session.run('<bench setup>', setup, engine=engine)
+        if error: raise Exception(error.as_string())
+
+    start = time.perf_counter()
+    value, error = session.run(f'<bench {name}>', source, engine=engine)
+    elapsed = time.perf_counter() - start
+    if error: raise Exception(error.as_string())
+    return elapsed
+
+
+# True when the optimizer turns the timed program, or the body of one of its
+# loops, into a literal: the workload would time nothing
+def folds(name):
+    node, error = basic.parse_program(f'<bench {name}>', WORKLOADS[name][1], optimize=True, constants=basic.constant_values(basic.Session().symbol_table))
+    if error: raise Exception(error.as_string())
+    if basic.is_literal(node): return True
+
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (basic.ForNode, basic.WhileNode)) and basic.is_literal(node.body_node): return True
+        stack += basic.child_nodes(node)
+    return False
+
+
+def summary(times):
+    return {
+        'runs': len(times),
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+
+
+def measure(engines, workloads, warmup, repeat):
+    results = {}
+    for engine in engines:
+        results[engine] = {}
+        for name in workloads:
+            for _ in range(warmup): time_workload(name, engine)
+            results[engine][name] = summary([time_workload(name, engine) for _ in range(repeat)])
+    return results
+
+
+# (engine, workload, baseline median, median, change) of every workload in both
+def compare(results, baseline):
+    rows = []
+    for engine, workloads in results.items():
+        for name, stats in workloads.items():
+            old = baseline.get(engine, {}).get(name)
+            if old is None: continue
+            rows.append((engine, name, old['median'], stats['median'], stats['median'] / old['median'] - 1))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time canonical workloads and compare them with a baseline.')
+    parser.add_argument('--engine', action='append', choices=basic.ENGINES, help='engine to time, repeatable (default: all)')
+    parser.add_argument('--workload', action='append', choices=list(WORKLOADS), help='workload to time, repeatable (default: all)')
+    parser.add_argument('--warmup', type=int, default=WARMUP, help=f'untimed runs first (default: {WARMUP})')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help=f'timed runs (default: {REPEAT})')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON file from an earlier --output to compare with')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help=f'allowed slowdown of a median, as a fraction (default: {THRESHOLD})')
+    args = parser.parse_args(argv)
+
+    engines = args.engine or basic.ENGINES
+    workloads = args.workload or list(WORKLOADS)
+    for name in workloads:
+        if folds(name): parser.error(f"workload '{name}' folds to a constant, take its operands from the setup program")
+    results = measure(engines, workloads, args.warmup, max(1, args.repeat))
+
+    print('median ms (stdev)')
+    print(f'{"workload":>14}' + ''.join(f'{engine:>20}' for engine in engines))
+    for name in workloads:
+        cells = [results[engine][name] for engine in engines]
+        print(f'{name:>14}' + ''.join(f'{stats["median"] * 1000:>11.2f} ({stats["stdev"] * 1000:>6.2f})' for stats in cells))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({
+                'python': platform.python_version(),
+                'warmup': args.warmup,
+                'repeat': args.repeat,
+                'results': results,
+            }, file, indent=2)
+
+    if not args.baseline: return 0
+
+    with open(args.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)['results']
+
+    regressed = 0
+    print()
+    print(f'against {args.baseline}, threshold {args.threshold:.0%}')
+    for engine, name, old, new, change in compare(results, baseline):
+        flag = 'REGRESSED' if change > args.threshold else ''
+        if flag: regressed += 1
+        print(f'{engine:>12} {name:>14} {old * 1000:>10.2f} -> {new * 1000:>10.2f} ms {change:>+8.1%} {flag}')
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    # call_chain recurses deeper than the default limit allows the interpreter
+    sys.setrecursionlimit(10000)
+    sys.exit(main())
@@ -0,0 +1,314 @@
+# Imports
+from basic import *
+
+
+# closure compiler
+# turns the tree produced by Parser.parse() into one Python closure per node,
+# built once. A closure takes the context and returns the node's value, with
+# the operator, names and positions it needs already bound, so running a
+# program is calling the root closure. Errors are raised as ScriptError and
+# only turned back into a RunTimeResult at the top.
+class ScriptError(Exception):
+    def __init__(self, error):
+        super().__init__(error)
+        self.error = error
+
+
+class ClosureCompiler:
+    def __init__(self):
+        # compiled function bodies, keyed by the body node of the Function
+        self.bodies = {}
+
+    def run(self, node, context):
+        res = RunTimeResult()
+        try:
+            value = self.compile(node)(context)
+        except ScriptError as error:
+            return res.failure(error.error)
+        return res.success(value)
+
+    def compile(self, node):
+        method_name = f'visit_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_visit_method)
+        return method(node)
+
+    def no_visit_method(self, node):
+        raise Exception(f'No visit_{type(node).__name__} method defined')
+
+    def body_for(self, function):
+        entry = self.bodies.get(id(function.body_node))
+        if entry is None:
+            entry = (function.body_node, self.compile(function.body_node))
+            self.bodies[id(function.body_node)] = entry
+        return entry[1]
+
+    # calls
+    def call(self, function, args, caller):
+        if function.memo:
+            key = memo_key(args)
+            if key is not None:
+                found, value = function.memo.get(key)
+                if found: return value
+
+                value = self.call_body(function, args, caller)
+                function.memo.store(key, value)
+                return value
+
+        return self.call_body(function, args, caller)
+
+    # same trampoline as Function.execute_body
+    def call_body(self, function, args, caller):
+        meter = function.context.symbol_table.root.meter
+        error = meter.enter(function, caller)
+        if error: raise ScriptError(error)
+
+        try:
+            while True:
+                new_context, error = function.enter(args)
+                if error: raise ScriptError(error)
+
+                value = self.body_for(function)(new_context)
+                if type(value) is not TailCall: return value
+                function, args = value.function, value.args
+        finally:
+            meter.leave()
+
+    # nodes
+    def visit_NumNode(self, node):
+        value = make_num(node.tok.value)
+        return lambda context: value
+
+    def visit_StringNode(self, node):
+        value = String(node.tok.value)
+        return lambda context: value
+
+    def visit_ListNode(self, node):
+        elements = [self.compile(element_node) for element_node in node.element_nodes]
+        pos_start, pos_end = node.pos_start, node.pos_end
+        size = REFERENCE_SIZE * len(elements)
+
+        def list_(context):
+            values = [element(context) for element in elements]
+            error = context.symbol_table.root.meter.allocate_at(size, node, context)
+            if error: raise ScriptError(error)
+            return List(values).set_context(context).set_pos(pos_start, pos_end)
+        return list_
+
+    def visit_VariableAccessNode(self, node):
+        name, depth, slot = node.variable_name_tok.value, node.depth, node.slot
+        pos_start, pos_end = node.pos_start, node.pos_end
+
+        def undefined(context):
+            raise ScriptError(RunTimeError(pos_start, pos_end, f"'{name}' is not defined", context))
+
+        if depth == 0 and slot is not None:
+            # bound in the frame of the function being run
+            def access(context):
+                symbol_table = context.symbol_table
+                value = symbol_table.slots[slot]
+                if value == None: value = symbol_table.get(name)
+                if not value: undefined(context)
+                return value
+        else:
+            def access(context):
+                value = context.symbol_table.lookup(name, depth, slot)
+                if not value: undefined(context)
+                return value
+        return access
+
+    def visit_VariableAssignNode(self, node):
+        value_closure = self.compile(node.value_node)
+        name, slot = node.variable_name_tok.value, node.slot
+
+        def assign(context):
+            value = value_closure(context)
+            context.symbol_table.assign(name, slot, value)
+            return value
+        return assign
+
+    def visit_BinaryOpNode(self, node):
+        left, right = self.compile(node.left_node), self.compile(node.right_node)
+        left_node, right_node = node.left_node, node.right_node
+        method_name, num_op, short_circuit = node.method_name, node.num_op, node.short_circuit
+
+        def other(left_value, right_value, context):
+            left_value = located(left_value, left_node, context)
+            right_value = located(right_value, right_node, context)
+            result, error = getattr(left_value, method_name)(right_value)
+            if error: raise ScriptError(error)
+            return result
+
+        if not num_op:
+            def divide(context):
+                left_value = left(context)
+                right_value = right(context)
+                if type(left_value) is Num and type(right_value) is Num:
+                    if right_value.value == 0:
+                        raise ScriptError(RunTimeError(
+                            right_node.pos_start, right_node.pos_end,
+                            'Division by zero',
+                            context
+                        ))
+                    return make_num(left_value.value / right_value.value)
+                return other(left_value, right_value, context)
+            return divide
+
+        if isinstance(right_node, NumNode):
+            # a literal right operand has no effects to skip, so short_circuit
+            # would give the same result
+            right_value = right(None)
+            right_num = right_value.value
+
+            def binary(context):
+                left_value = left(context)
+                if type(left_value) is Num:
+                    return make_num(num_op(left_value.value, right_num))
+                return other(left_value, right_value, context)
+            return binary
+
+        if short_circuit is not None:
+            def binary(context):
+                left_value = left(context)
+                if type(left_value) is Num and (left_value.value != 0) == short_circuit:
+                    return make_num(int(left_value.value))
+                right_value = right(context)
+                if type(left_value) is Num and type(right_value) is Num:
+                    return make_num(num_op(left_value.value, right_value.value))
+                return other(left_value, right_value, context)
+            return binary
+
+        def binary(context):
+            left_value = left(context)
+            right_value = right(context)
+            if type(left_value) is Num and type(right_value) is Num:
+                return make_num(num_op(left_value.value, right_value.value))
+            return other(left_value, right_value, context)
+        return binary
+
+    def visit_UnaryOpNode(self, node):
+        operand = self.compile(node.node)
+        if node.method_name is None: return operand
+        method_name, num_op = node.method_name, node.num_op
+
+        def unary(context):
+            value = operand(context)
+            if type(value) is Num: return make_num(num_op(value.value))
+
+            args = () if node.operand is None else (located(Num(node.operand), node, context),)
+            value, error = getattr(located(value, node.node, context), method_name)(*args)
+            if error: raise ScriptError(error)
+            return value
+        return unary
+
+    def visit_IfNode(self, node):
+        cases = [(self.compile(condition), self.compile(expr)) for condition, expr in node.cases]
+        else_case = self.compile(node.else_case) if node.else_case else None
+
+        def if_(context):
+            for condition, expr in cases:
+                if condition(context).is_true():
+                    return expr(context)
+            if else_case: return else_case(context)
+            return None
+        return if_
+
+    def visit_ForNode(self, node):
+        start = self.compile(node.start_value_node)
+        end = self.compile(node.end_value_node)
+        step = self.compile(node.step_value_node) if node.step_value_node else None
+        body = self.compile(node.body_node)
+        name, slot = node.variable_name_tok.value, node.slot
+        pos_start, pos_end = node.pos_start, node.pos_end
+
+        def for_(context):
+            start_value = start(context)
+            end_value = end(context)
+            step_value = step(context) if step else None
+
+            i = start_value.value
+            step_value = step_value.value if step else 1
+            ascending = step_value >= 0
+
+            # element k of a lazy loop is rebuilt from start + k * step, which only matches for ints
+            lazy = node.lazy and type(i) is int and type(step_value) is int
+            collect = not (node.discard or lazy)
+            elements = []
+            count = 0
+            symbol_table = context.symbol_table
+            meter = symbol_table.root.meter
+
+            while (i < end_value.value) if ascending else (i > end_value.value):
+                symbol_table.assign(name, slot, make_num(i))
+                i += step_value
+
+                value = body(context)
+                if collect:
+                    elements.append(value)
+                    error = meter.allocate_at(REFERENCE_SIZE, node, context)
+                    if error: raise ScriptError(error)
+                count += 1
+
+                meter.countdown -= 1
+                if not meter.countdown:
+                    error = meter.check(node, context)
+                    if error: raise ScriptError(error)
+
+            if lazy:
+                elements = LoopElements(node, context, start_value.value, step_value, count)
+            return List(elements).set_context(context).set_pos(pos_start, pos_end)
+        return for_
+
+    def visit_WhileNode(self, node):
+        condition = self.compile(node.condition_node)
+        body = self.compile(node.body_node)
+        discard = node.discard
+        pos_start, pos_end = node.pos_start, node.pos_end
+
+        def while_(context):
+            elements = []
+            meter = context.symbol_table.root.meter
+            while condition(context).is_true():
+                value = body(context)
+                if not discard:
+                    elements.append(value)
+                    error = meter.allocate_at(REFERENCE_SIZE, node, context)
+                    if error: raise ScriptError(error)
+
+                meter.countdown -= 1
+                if not meter.countdown:
+                    error = meter.check(node, context)
+                    if error: raise ScriptError(error)
+            return List(elements).set_context(context).set_pos(pos_start, pos_end)
+        return while_
+
+    def visit_FuncDefNode(self, node):
+        func_name = node.variable_name_tok.value if node.variable_name_tok else None
+        arg_names = [arg_name.value for arg_name in node.arg_name_toks]
+        body_node, scope, slot, memo_size = node.body_node, node.scope, node.slot, node.memo_size
+        pos_start, pos_end = node.pos_start, node.pos_end
+
+        def function(context):
+            memo = Memo(memo_size) if memo_size is not None else None
+            func_value = Function(func_name, body_node, arg_names, scope, memo).set_context(context).set_pos(pos_start, pos_end)
+            if func_name: context.symbol_table.assign(func_name, slot, func_value)
+            return func_value
+        return function
+
+    def visit_CallNode(self, node):
+        to_call = self.compile(node.node_to_call)
+        arg_closures = [self.compile(arg_node) for arg_node in node.arg_nodes]
+        tail = node.tail
+
+        def call(context):
+            value_to_call = callee(to_call(context), node, context)
+            args = [arg(context) for arg in arg_closures]
+
+            if type(value_to_call) is Function:
+                if tail and not value_to_call.memo:
+                    return TailCall(value_to_call, args)
+                return self.call(value_to_call, args, context)
+
+            res = value_to_call.execute(args)
+            if res.error: raise ScriptError(res.error)
+            return res.value
+        return call
@@ -0,0 +1,160 @@
+# persistent vector used as List storage
+#
+# elements live in tuples of at most CHUNK items, the leaves of a height
+# balanced (AVL) tree whose nodes know their size. The last few appended
+# elements are kept in a separate tail tuple so most appends only copy that.
+# Nothing is ever changed in place: every operation returns a new PVector that
+# shares all untouched chunks and nodes with the old one.
+#
+#   append   O(1) amortised, O(log n) when the tail spills into the tree
+#   index    O(log n)
+#   delete   O(log n)
+#   concat   O(log n)
+from operator import index as _index
+
+CHUNK = 32
+
+
+class _Node:
+    __slots__ = ('left', 'right', 'size', 'height')
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.size = _size(left) + _size(right)
+        self.height = max(_height(left), _height(right)) + 1
+
+
+def _size(tree):
+    if tree is None: return 0
+    if type(tree) is tuple: return len(tree)
+    return tree.size
+
+def _height(tree):
+    if tree is None: return -1
+    if type(tree) is tuple: return 0
+    return tree.height
+
+# node over two subtrees whose heights differ by at most two
+def _balance(left, right):
+    if left is None: return right
+    if right is None: return left
+
+    left_height, right_height = _height(left), _height(right)
+
+    if left_height > right_height + 1:
+        if _height(left.left) >= _height(left.right):
+            return _Node(left.left, _Node(left.right, right))
+        middle = left.right
+        return _Node(_Node(left.left, middle.left), _Node(middle.right, right))
+
+    if right_height > left_height + 1:
+        if _height(right.right) >= _height(right.left):
+            return _Node(_Node(left, right.left), right.right)
+        middle = right.left
+        return _Node(_Node(left, middle.left), _Node(middle.right, right.right))
+
+    return _Node(left, right)
+
+def _concat(left, right):
+    if left is None: return right
+    if right is None: return left
+
+    left_height, right_height = _height(left), _height(right)
+
+    if left_height > right_height + 1:
+        return _balance(left.left, _concat(left.right, right))
+    if right_height > left_height + 1:
+        return _balance(_concat(left, right.left), right.right)
+    return _Node(left, right)
+
+def _get(tree, i):
+    while type(tree) is not tuple:
+        left_size = _size(tree.left)
+        if i < left_size:
+            tree = tree.left
+        else:
+            i -= left_size
+            tree = tree.right
+    return tree[i]
+
+def _delete(tree, i):
+    if type(tree) is tuple:
+        return tree[:i] + tree[i + 1:] or None
+
+    left_size = _size(tree.left)
+    if i < left_size:
+        return _balance(_delete(tree.left, i), tree.right)
+    return _balance(tree.left, _delete(tree.right, i - left_size))
+
+def _build(chunks, start, end):
+    if end - start == 1: return chunks[start]
+    middle = (start + end) // 2
+    return _Node(_build(chunks, start, middle), _build(chunks, middle, end))
+
+
+class PVector:
+    __slots__ = ('tree', 'tail', 'length')
+
+    def __init__(self, elements=(), tree=None, tail=None):
+        if tail is None:
+            elements = tuple(elements)
+            full = len(elements) - (len(elements) % CHUNK or CHUNK)
+            chunks = [elements[i:i + CHUNK] for i in range(0, max(full, 0), CHUNK)]
+            tree = _build(chunks, 0, len(chunks)) if chunks else None
+            tail = elements[max(full, 0):]
+
+        self.tree = tree
+        self.tail = tail
+        self.length = _size(tree) + len(tail)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        stack = [self.tree] if self.tree is not None else []
+        while stack:
+            tree = stack.pop()
+            if type(tree) is tuple:
+                yield from tree
+            else:
+                stack.append(tree.right)
+                stack.append(tree.left)
+        yield from self.tail
+
+    # same index rules as a Python list: negatives count from the end,
+    # IndexError when out of range and TypeError for non-integers
+    def normalise(self, i):
+        i = _index(i)
+        if i < 0: i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError('PVector index out of range')
+        return i
+
+    def __getitem__(self, i):
+        i = self.normalise(i)
+        tree_size = self.length - len(self.tail)
+        if i >= tree_size:
+            return self.tail[i - tree_size]
+        return _get(self.tree, i)
+
+    def append(self, value):
+        if len(self.tail) < CHUNK:
+            return PVector(tree=self.tree, tail=self.tail + (value,))
+        return PVector(tree=_concat(self.tree, self.tail), tail=(value,))
+
+    def delete(self, i):
+        i = self.normalise(i)
+        tree_size = self.length - len(self.tail)
+        if i >= tree_size:
+            i -= tree_size
+            return PVector(tree=self.tree, tail=self.tail[:i] + self.tail[i + 1:])
+        return PVector(tree=_delete(self.tree, i), tail=self.tail)
+
+    def concat(self, other):
+        if not isinstance(other, PVector): other = PVector(other)
+        tree = _concat(self.tree, self.tail or None)
+        return PVector(tree=_concat(tree, other.tree), tail=other.tail)
+
+    def __repr__(self):
+        return f'PVector({list(self)!r})'
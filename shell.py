@@ -1,10 +1,13 @@
+import sys
 
 import basic
 
+# optional engine name, e.g. `python shell.py vm`
+engine = sys.argv[1] if len(sys.argv) > 1 else 'interpreter'
+
 while True:
         text = input('fragmentation > ')
-        result, error = basic.run('<stdin>', text)
+        result, error = basic.run('<stdin>', text, engine)
 
         if error: print(error.as_string())
         elif result: print(result)
-
@@ -0,0 +1,155 @@
+# Every engine, with either lexer and with or without the optimizer, must
+# give the same values and the same tracebacks as the tree-walking
+# interpreter with the regex lexer. Each session of the corpus runs in a
+# fresh Session, line by line, so later lines see the globals of earlier ones.
+import random
+import tempfile
+import unittest
+
+import basic
+from pvector import CHUNK, PVector
+
+SESSIONS = [
+    ['1 + 2 * 3', '(1 + 2) * 3', '2 ^ 10', '10 / 4', '7 - 10', '-5 + 3', '--5', '+3', '1.5 * 2'],
+    ['1 == 1', '1 != 1', '2 < 3', '2 > 3', '2 <= 2', '3 >= 4', '1 ADDITIONALLY 0', '0 ALTERNATIVELY 2', 'NOT 0', 'NOT 1 == 2'],
+    ['1 / 0', '5 + "a"', '"a" - 1', 'x', 'VARIABLE x = 5', 'x * 2', 'x / (x - 5)', 'TRUE', 'FALSE + NULL'],
+    ['"hello" + " world"', '"ab" * 3', '[1, 2, 3]', '[]', '[1, 2] + 3', '[1, 2, 3] - 0', '[1,2,3] - 5', '[1, 2] * [3, 4]', '[1, 2] * 3', '[10, 20, 30] / 1', '[10, 20] / 7', '[10, 20] / -1', '[1, 2] / 1.0'],
+    ['VARIABLE l = [1, 2, 3]', 'VARIABLE m = l + 4', 'l', 'm', 'VARIABLE n = l - 0', 'l', 'n', 'l * m'],
+    ['FOR i = 0 TO 5 DO i * i', 'FOR i = 10 TO 0 STEP -2 DO i', 'FOR i = 0 TO 0 DO i', 'i', 'VARIABLE s = 0', 'FOR i = 1 TO 11 DO VARIABLE s = s + i', 's'],
+    ['VARIABLE i = 0', 'WHILE i < 5 DO VARIABLE i = i + 1', 'i', 'WHILE 0 DO 1'],
+    ['IF 1 DO 10 ELSE 20', 'IF 0 DO 10 ORIF 1 DO 30 ELSE 20', 'IF 0 DO 10'],
+    ['FUN add(a, b) -> a + b', 'add(2, 3)', 'add(1)', 'add(1, 2, 3)', '(FUN (x) -> x * 2)(21)', 'add', 'add("a", 1)'],
+    ['FUN fib(n) -> IF n < 2 DO n ELSE fib(n - 1) + fib(n - 2)', 'fib(10)', 'FOR k = 0 TO 8 DO fib(k)'],
+    ['FUN f(x) -> x / 0', 'FUN g(y) -> f(y) + 1', 'g(3)', 'FUN h() -> g(1)', 'h()'],
+    ['VARIABLE k = 3', 'FUN mk(a) -> FUN (b) -> a + b + k', 'VARIABLE adder = mk(10)', 'adder(5)', 'VARIABLE k = 100', 'adder(5)'],
+    ['FUN ap(fn, v) -> fn(v)', 'FUN dbl(z) -> z * 2', 'ap(dbl, 4)', 'FUN gy() -> yy', 'FUN pass(h, yy) -> h()', 'pass(gy, 7)', 'gy()'],
+    ['5(1)', '"s"()', 'VARIABLE q = FUN (a) -> a', 'q(1, 2)', 'FUN inner() -> undefinedvar', 'FUN outer() -> inner()', 'outer()'],
+    ['FUN loop(n, acc) -> IF n == 0 DO acc ELSE loop(n - 1, acc + n)', 'loop(100, 0)', 'FUN cnt(n) -> IF n > 0 DO cnt(n - 1) ELSE 1 / 0', 'cnt(3)'],
+    ['FOR i = 0 TO 3 DO i + "a"', 'VARIABLE w = 0', 'WHILE w < 3 DO (VARIABLE w = w + 1) / (w - 2)'],
+    ['1 +', '(1 + 2', 'FOR x 1', 'VARIABLE = 3', '1 $ 2', 'FUN f(a, 1) -> a', '[1, 2', '"unterminated', '1.2.3'],
+    ['2 ^ 3 ^ 2', '-2 ^ 2', '2 * -3', '1 - - 1', 'NOT NOT 3', '10 / 2 / 5', '3 == 3 == 1'],
+    ['VARIABLE TRUE = 0', 'IF TRUE DO 1 ELSE 2', '2 ^ 10 * 3', '"a" + "b" * 2', '1 / (2 - 2)', 'IF 1 DO 1 / 0 ELSE 3'],
+    ['FUN nest(a) -> FUN (b) -> FUN (c) -> a + b + c + missing', 'nest(1)(2)(3)', 'FUN tl(n) -> IF n == 0 DO x / 0 ELSE tl(n - 1)', 'VARIABLE x = 1', 'tl(2)'],
+    ['VARIABLE k = 1', 'VARIABLE l = FOR i = 0 TO 5 DO i * k', 'VARIABLE k = 2', 'l', 'l / 3', 'l / -1', 'l - 0', 'l + 7', 'l * l', 'FOR i = 0 TO 3 DO i / (i - 2)'],
+    ['FUN MEMO sq(n) -> n * n', 'sq(4)', 'sq(4)', 'FUN MEMO 2 fm(n) -> IF n < 2 DO n ELSE fm(n - 1) + fm(n - 2)', 'fm(20)', 'FUN MEMO bad(n) -> n + k'],
+    ['FUN g(x) -> x + 1', 'FUN MEMO q(x) -> g(x)', 'FUN MEMO t(n) -> IF n DO TRUE ELSE FALSE', 'FUN MEMO v(n) -> VARIABLE z = n', 'FUN MEMO s(n) -> FOR i = 0 TO n DO i * n', 's(4)', 'FUN MEMO r(n) -> i + (FOR i = 0 TO n DO i)', 'FUN MEMO c(n) -> s(n) + sq(n)', 'FUN MEMO sq(n) -> n * n', 'FUN MEMO c(n) -> s(n) + sq(n)', 'c(3)'],
+]
+
+CONFIGURATIONS = [
+    {'engine': engine, 'lexer': lexer, 'optimize': optimize}
+    for engine in basic.ENGINES for lexer in basic.LEXERS for optimize in (False, True)
+]
+
+
+def outcome(value, error):
+    return ('error', error.as_string()) if error else ('value', repr(value))
+
+
+def run_sessions(**options):
+    results = []
+    for lines in SESSIONS:
+        session = basic.Session()
+        for line in lines:
+            results.append((line, outcome(*session.run('<test>', line, cache=None, **options))))
+    return results
+
+
+class EngineTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.expected = run_sessions(engine='interpreter', lexer='regex', optimize=False)
+
+    def test_configurations_match_interpreter(self):
+        for options in CONFIGURATIONS:
+            with self.subTest(**options):
+                for (line, expected), (_, actual) in zip(self.expected, run_sessions(**options)):
+                    self.assertEqual(actual, expected, line)
+
+    def test_short_circuit_matches(self):
+        expected = run_sessions(short_circuit=True)
+        for engine in basic.ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(run_sessions(engine=engine, short_circuit=True), expected)
+
+    def test_limit_failures_match(self):
+        setup = [
+            'FUN down(n) -> IF n == 0 DO 0 ELSE down(n - 1) + 1', 'FUN g() -> down(50)', 'FUN spin() -> FOR i = 0 TO 100000 DO i',
+            'FUN keep() -> FOR i = 0 TO 100000 DO VARIABLE last = i', 'VARIABLE w = 0', 'VARIABLE s = ""',
+        ]
+        cases = [
+            ('g()', basic.Limits(depth=20)), ('down(50)', basic.Limits(depth=20)), ('spin()', basic.Limits(steps=5000)),
+            ('keep()', basic.Limits(memory=10000)), ('WHILE w < 100000 DO VARIABLE w = w + 1', basic.Limits(memory=10000)),
+            ('[1, 2, [3, 4]]', basic.Limits(memory=30)), ('FOR i = 0 TO 100 DO VARIABLE s = s + "ab"', basic.Limits(memory=2000)),
+        ]
+        for line, limits in cases:
+            results = {}
+            for engine in basic.ENGINES:
+                session = basic.Session()
+                for setup_line in setup: session.run('<test>', setup_line, engine=engine)
+                value, error = session.run('<test>', line, engine=engine, limits=limits)
+                results[engine] = outcome(value, error)
+            self.assertEqual(results['interpreter'][0], 'error', line)
+            for engine in basic.ENGINES:
+                with self.subTest(engine=engine, line=line):
+                    self.assertEqual(results[engine], results['interpreter'])
+
+    def test_cache_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for options in CONFIGURATIONS:
+                with self.subTest(**options):
+                    writer = basic.ProgramCache(directory=directory)
+                    reader = basic.ProgramCache(directory=directory)
+                    # programs that do not parse are never cached
+                    unparsed = 0
+                    for lines in SESSIONS:
+                        written, read = basic.Session(), basic.Session()
+                        for line in lines:
+                            value, error = written.run('<test>', line, cache=writer, **options)
+                            if error and not isinstance(error, basic.RunTimeError): unparsed += 1
+                            self.assertEqual(outcome(*read.run('<test>', line, cache=reader, **options)), outcome(value, error), line)
+                    self.assertEqual(reader.misses, unparsed)
+                    self.assertGreater(reader.disk_hits, 0)
+
+
+class PVectorTests(unittest.TestCase):
+    def test_matches_list(self):
+        rng = random.Random(0)
+        vector, model = PVector(), []
+        for _ in range(3000):
+            operation = rng.random()
+            if operation < 0.5:
+                value = rng.randrange(1000)
+                vector, model = vector.append(value), model + [value]
+            elif operation < 0.7 and model:
+                i = rng.randrange(-len(model), len(model))
+                vector, model = vector.delete(i), model[:]
+                del model[i]
+            elif operation < 0.85:
+                other = [rng.randrange(1000) for _ in range(rng.randrange(3 * CHUNK))]
+                vector, model = vector.concat(PVector(other)), model + other
+            else:
+                other = [rng.randrange(1000) for _ in range(rng.randrange(3 * CHUNK))]
+                vector, model = PVector(other).concat(vector), other + model
+            self.assertEqual(len(vector), len(model))
+            if model:
+                i = rng.randrange(-len(model), len(model))
+                self.assertEqual(vector[i], model[i])
+        self.assertEqual(list(vector), model)
+
+    def test_operations_leave_original(self):
+        vector = PVector(range(5 * CHUNK))
+        vector.append(-1)
+        vector.delete(3)
+        vector.concat(PVector(range(10)))
+        self.assertEqual(list(vector), list(range(5 * CHUNK)))
+
+    def test_index_errors(self):
+        vector = PVector(range(3))
+        with self.assertRaises(IndexError): vector[3]
+        with self.assertRaises(IndexError): vector[-4]
+        with self.assertRaises(IndexError): vector.delete(3)
+        with self.assertRaises(TypeError): vector[1.0]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,578 @@
+# Imports
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from basic import *
+from closures import ClosureCompiler, ScriptError
+
+
+# transpiler
+# writes the tree produced by Parser.parse() out as the source of a Python
+# function, which is compile()d once and cached. FOR and WHILE become Python
+# loops, every FUN body becomes a def of its own, Num with Num operations are
+# written inline and everything else goes through the runtime helpers below,
+# which share the Interpreter's rules. Each generated line remembers the node
+# it came from, so errors can still point into the script.
+#
+# Temporaries known to hold a Num are tracked with the Python expression of
+# their raw value: operations on them skip the type checks, and a Num that
+# is only ever used through its raw value is not made at all. Inside a FOR
+# body without calls or bindings nothing can look the loop variable up
+# before the loop ends, so it is kept raw and only stored when the loop stops.
+
+# Num with Num operations on the raw values, keyed by method name
+PY_OPS = {
+    'plussed': '{} + {}',
+    'minused': '{} - {}',
+    'multiplied': '{} * {}',
+    'topowerof': '{} ** {}',
+    'get_equals': 'int({} == {})',
+    'get_notequals': 'int({} != {})',
+    'get_lessthan': 'int({} < {})',
+    'get_greaterthan': 'int({} > {})',
+    'get_lessthanequals': 'int({} <= {})',
+    'get_greaterthanequals': 'int({} >= {})',
+    'additionally': 'int({} and {})',
+    'alternatively': 'int({} or {})',
+}
+
+PY_UNARY_OPS = {
+    'multiplied': '{} * -1',
+    'notted': '(1 if {} == 0 else 0)',
+}
+
+class Transpiler:
+    # function is True for a FUN body, whose names live in slots, and False
+    # for a program, which runs against the globals
+    def __init__(self, function=False):
+        self.function = function
+        self.lines = []
+        self.line_nodes = []
+        self.namespace = {}
+        self.refs = {}
+        self.temps = 0
+        self.indent = 1
+        # temporaries holding a Num, with the expression of the raw value
+        self.known = {}
+        # lines making a Num from a raw value, dropped when the Num is unused
+        self.boxes = []
+        # raw loop variables of the FOR bodies being written, by name
+        self.loop_variables = {}
+
+    # source of `def name(context)` and the node of every line
+    def transpile(self, node, name):
+        result = self.visit(node)
+        self.emit(f'return {result}', node)
+
+        # a Num only named where it is made is never needed
+        uses = Counter(re.findall(r'\bt\d+\b', '\n'.join(self.lines)))
+        for at, temp in self.boxes:
+            if uses[temp] == 1:
+                line = self.lines[at]
+                self.lines[at] = line[:len(line) - len(line.lstrip())] + 'pass'
+
+        prologue = [
+            f'def {name}(context):',
+            '    table = context.symbol_table',
+            '    symbols = table.symbols',
+            '    slots = table.slots',
+            '    lexical = table.lexical',
+            '    root = table.root.symbols',
+            '    meter = table.root.meter',
+        ]
+        source = '\n'.join(prologue + self.lines) + '\n'
+        return source, [None] * len(prologue) + self.line_nodes
+
+    def emit(self, line, node):
+        self.lines.append('    ' * self.indent + line)
+        self.line_nodes.append(node)
+
+    def temp(self):
+        self.temps += 1
+        return f't{self.temps}'
+
+    # a loop iteration is a step of the run, see Meter
+    def count_step(self, n, node):
+        self.emit('meter.countdown -= 1', node)
+        self.emit(f'if not meter.countdown: check_limits(meter, {n}, context)', node)
+
+    # a List literal or a collected loop value takes size bytes, see Meter.allocate
+    def count_allocation(self, n, size, node):
+        self.emit(f'allocate(meter, {size}, {n}, context)', node)
+
+    # result = Num of the raw value, see self.boxes
+    def box(self, result, raw, node):
+        self.boxes.append((len(self.lines), result))
+        self.emit(f'{result} = make_num({raw})', node)
+
+    # expression of the raw value of a temporary
+    def raw_value(self, value):
+        return self.known.get(value, f'{value}.value')
+
+    # name under which obj is reachable from the generated source
+    def ref(self, obj, prefix='n'):
+        name = self.refs.get(id(obj))
+        if name is None:
+            name = f'{prefix}{len(self.refs)}'
+            self.refs[id(obj)] = name
+            self.namespace[name] = obj
+        return name
+
+    # raw value of a Num literal as Python source
+    def raw(self, value):
+        if type(value) is int or math.isfinite(value): return f'({value!r})'
+        return self.ref(value, 'c')
+
+    def visit(self, node):
+        method_name = f'visit_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_visit_method)
+        return method(node)
+
+    def no_visit_method(self, node):
+        raise Exception(f'No visit_{type(node).__name__} method defined')
+
+    def visit_NumNode(self, node):
+        value = self.ref(make_num(node.tok.value), 'c')
+        self.known[value] = self.raw(node.tok.value)
+        return value
+
+    def visit_StringNode(self, node):
+        return self.ref(String(node.tok.value), 'c')
+
+    def visit_ListNode(self, node):
+        elements = [self.visit(element_node) for element_node in node.element_nodes]
+        result, n = self.temp(), self.ref(node)
+        if elements: self.count_allocation(n, REFERENCE_SIZE * len(elements), node)
+        self.emit(f'{result} = List([{", ".join(elements)}]).set_context(context).set_pos({n}.pos_start, {n}.pos_end)', node)
+        return result
+
+    def visit_VariableAccessNode(self, node):
+        result, n = self.temp(), self.ref(node)
+        name = repr(node.variable_name_tok.value)
+
+        if node.variable_name_tok.value in self.loop_variables:
+            raw = self.loop_variables[node.variable_name_tok.value]
+            self.box(result, raw, node)
+            self.known[result] = raw
+            return result
+
+        if not self.function:
+            self.emit(f'{result} = symbols.get({name})', node)
+        elif node.depth == 0 and node.slot is not None:
+            self.emit(f'{result} = slots[{node.slot}]', node)
+            self.emit(f'if {result} is None: {result} = table.get({name})', node)
+        elif node.slot is None:
+            self.emit(f'{result} = root.get({name}) if lexical else table.get({name})', node)
+        else:
+            self.emit(f'{result} = table.lookup({name}, {node.depth}, {node.slot})', node)
+
+        self.emit(f'if {result} is None: undefined({n}, context)', node)
+        return result
+
+    # statement binding a name, see SymbolTable.assign
+    def store(self, name, slot, value):
+        if slot is not None: return f'slots[{slot}] = {value}'
+        if not self.function: return f'symbols[{name!r}] = {value}'
+        return f'table.set({name!r}, {value})'
+
+    def visit_VariableAssignNode(self, node):
+        value = self.visit(node.value_node)
+        self.emit(self.store(node.variable_name_tok.value, node.slot, value), node)
+        return value
+
+    def visit_BinaryOpNode(self, node):
+        left = self.visit(node.left_node)
+        result = self.temp()
+
+        # a literal right operand has nothing to skip
+        if node.short_circuit is None or isinstance(node.right_node, NumNode):
+            raw = self.binary(node, left, result)
+            if raw: self.known[result] = raw
+            return result
+
+        left_raw = self.raw_value(left)
+        if left in self.known:
+            self.emit(f'if ({left_raw} != 0) == {node.short_circuit}:', node)
+        else:
+            self.emit(f'if type({left}) is Num and ({left_raw} != 0) == {node.short_circuit}:', node)
+        self.emit(f'    {result} = make_num(int({left_raw}))', node)
+        self.emit('else:', node)
+        self.indent += 1
+        self.binary(node, left, result)
+        self.indent -= 1
+        return result
+
+    # result = left op right, returns the raw value's expression when the
+    # result is sure to be a Num
+    def binary(self, node, left, result):
+        right = self.visit(node.right_node)
+        n = self.ref(node)
+        left_raw, right_raw = self.raw_value(left), self.raw_value(right)
+        checks = [f'type({value}) is Num' for value in (left, right) if value not in self.known]
+
+        if node.num_op is None:
+            zero_check = f'if {right_raw} == 0: division_by_zero({n}, context)'
+            expression = f'{left_raw} / {right_raw}'
+        else:
+            zero_check = None
+            expression = PY_OPS[node.method_name].format(left_raw, right_raw)
+
+        if not checks:
+            if zero_check: self.emit(zero_check, node)
+            raw = self.temp()
+            self.emit(f'{raw} = {expression}', node)
+            self.box(result, raw, node)
+            return raw
+
+        self.emit(f'if {" and ".join(checks)}:', node)
+        if zero_check: self.emit(f'    {zero_check}', node)
+        self.emit(f'    {result} = make_num({expression})', node)
+        self.emit('else:', node)
+        self.emit(f'    {result} = binary({n}, {left}, {right}, context)', node)
+        return None
+
+    def visit_UnaryOpNode(self, node):
+        value = self.visit(node.node)
+        if node.method_name is None: return value
+
+        result, n = self.temp(), self.ref(node)
+        expression = PY_UNARY_OPS[node.method_name].format(self.raw_value(value))
+        if value in self.known:
+            raw = self.temp()
+            self.emit(f'{raw} = {expression}', node)
+            self.box(result, raw, node)
+            self.known[result] = raw
+            return result
+
+        self.emit(f'if type({value}) is Num: {result} = make_num({expression})', node)
+        self.emit(f'else: {result} = unary({n}, {value}, context)', node)
+        return result
+
+    def visit_IfNode(self, node):
+        result = self.temp()
+        self.if_case(node, 0, result)
+        return result
+
+    # case i and every case after it, nested in the else of the one before
+    def if_case(self, node, i, result):
+        if i == len(node.cases):
+            if node.else_case:
+                value = self.visit(node.else_case)
+                self.emit(f'{result} = {value}', node.else_case)
+            else:
+                self.emit(f'{result} = None', node)
+            return
+
+        condition, expr = node.cases[i]
+        condition_value = self.visit(condition)
+        if condition_value in self.known:
+            self.emit(f'if {self.known[condition_value]} != 0:', condition)
+        else:
+            self.emit(f'if {condition_value}.is_true():', condition)
+        self.indent += 1
+        value = self.visit(expr)
+        self.emit(f'{result} = {value}', expr)
+        self.indent -= 1
+        self.emit('else:', condition)
+        self.indent += 1
+        self.if_case(node, i + 1, result)
+        self.indent -= 1
+
+    def visit_ForNode(self, node):
+        result, n = self.temp(), self.ref(node)
+        i, end, step, elements, count = self.temp(), self.temp(), self.temp(), self.temp(), self.temp()
+
+        start_value = self.visit(node.start_value_node)
+        end_value = self.visit(node.end_value_node)
+        step_value = self.visit(node.step_value_node) if node.step_value_node else None
+
+        self.emit(f'{i} = {start_value}.value', node)
+        self.emit(f'{end} = {end_value}.value', node)
+        self.emit(f'{step} = {step_value}.value' if step_value else f'{step} = 1', node)
+
+        # direction is known up front unless the step is worked out at run time
+        if not node.step_value_node:
+            condition = f'{i} < {end}'
+        elif isinstance(node.step_value_node, NumNode):
+            condition = f'{i} < {end}' if node.step_value_node.tok.value >= 0 else f'{i} > {end}'
+        else:
+            condition = f'({i} < {end} if {step} >= 0 else {i} > {end})'
+
+        # element k of a lazy loop is rebuilt from start + k * step, which only matches for ints
+        lazy = None
+        if node.lazy:
+            lazy = self.temp()
+            self.emit(f'{lazy} = type({i}) is int and type({step}) is int', node)
+            self.emit(f'{count} = 0', node)
+        if not node.discard:
+            self.emit(f'{elements} = []', node)
+
+        name = node.variable_name_tok.value
+        raw = self.temp() if is_pure(node.body_node) else None
+        if raw:
+            # the variable is stored once the loop ends, also when the body fails
+            self.emit(f'{raw} = None', node)
+            self.emit('try:', node)
+            self.indent += 1
+
+        self.emit(f'while {condition}:', node)
+        self.indent += 1
+        if raw:
+            self.emit(f'{raw} = {i}', node)
+            outer = self.loop_variables.get(name)
+            self.loop_variables[name] = raw
+        else:
+            self.emit(self.store(name, node.slot, f'make_num({i})'), node)
+        self.emit(f'{i} += {step}', node)
+
+        value = self.visit(node.body_node)
+        if lazy:
+            self.emit(f'if not {lazy}:', node)
+            self.indent += 1
+            self.emit(f'{elements}.append({value})', node)
+            self.count_allocation(n, REFERENCE_SIZE, node)
+            self.indent -= 1
+            self.emit(f'{count} += 1', node)
+        elif not node.discard:
+            self.emit(f'{elements}.append({value})', node)
+            self.count_allocation(n, REFERENCE_SIZE, node)
+        self.count_step(n, node)
+        self.indent -= 1
+
+        if raw:
+            if outer: self.loop_variables[name] = outer
+            else: del self.loop_variables[name]
+            self.indent -= 1
+            self.emit('finally:', node)
+            self.emit(f'    if {raw} is not None: {self.store(name, node.slot, f"make_num({raw})")}', node)
+
+        if lazy:
+            self.emit(f'if {lazy}: {elements} = LoopElements({n}, context, {start_value}.value, {step}, {count})', node)
+        collected = '[]' if node.discard else elements
+        self.emit(f'{result} = List({collected}).set_context(context).set_pos({n}.pos_start, {n}.pos_end)', node)
+        return result
+
+    def visit_WhileNode(self, node):
+        result, n, elements = self.temp(), self.ref(node), self.temp()
+        if not node.discard:
+            self.emit(f'{elements} = []', node)
+
+        self.emit('while True:', node)
+        self.indent += 1
+        condition = self.visit(node.condition_node)
+        if condition in self.known:
+            self.emit(f'if {self.known[condition]} == 0: break', node.condition_node)
+        else:
+            self.emit(f'if not {condition}.is_true(): break', node.condition_node)
+        value = self.visit(node.body_node)
+        if not node.discard:
+            self.emit(f'{elements}.append({value})', node)
+            self.count_allocation(n, REFERENCE_SIZE, node)
+        self.count_step(n, node)
+        self.indent -= 1
+
+        collected = '[]' if node.discard else elements
+        self.emit(f'{result} = List({collected}).set_context(context).set_pos({n}.pos_start, {n}.pos_end)', node)
+        return result
+
+    def visit_FuncDefNode(self, node):
+        result, n = self.temp(), self.ref(node)
+        self.emit(f'{result} = make_function({n}, context)', node)
+        return result
+
+    def visit_CallNode(self, node):
+        result, n = self.temp(), self.ref(node)
+        value_to_call = self.visit(node.node_to_call)
+        function = self.temp()
+        self.emit(f'{function} = callee({value_to_call}, {n}, context)', node)
+
+        args = f'[{", ".join(self.visit(arg_node) for arg_node in node.arg_nodes)}]'
+        self.emit(f'if type({function}) is Function:', node)
+        if node.tail:
+            self.emit(f'    {result} = call({function}, {args}, context) if {function}.memo else TailCall({function}, {args})', node)
+        else:
+            self.emit(f'    {result} = call({function}, {args}, context)', node)
+        self.emit(f'else: {result} = execute({function}, {args})', node)
+        return result
+
+
+# runtime
+# helpers the generated source calls, failures are raised as ScriptError
+def undefined(node, context):
+    raise ScriptError(RunTimeError(
+        node.pos_start, node.pos_end,
+        f"'{node.variable_name_tok.value}' is not defined",
+        context
+    ))
+
+def division_by_zero(node, context):
+    raise ScriptError(RunTimeError(
+        node.right_node.pos_start, node.right_node.pos_end,
+        'Division by zero',
+        context
+    ))
+
+def binary(node, left, right, context):
+    left = located(left, node.left_node, context)
+    right = located(right, node.right_node, context)
+    result, error = getattr(left, node.method_name)(right)
+    if error: raise ScriptError(error)
+    return result
+
+def unary(node, value, context):
+    args = () if node.operand is None else (located(Num(node.operand), node, context),)
+    value, error = getattr(located(value, node.node, context), node.method_name)(*args)
+    if error: raise ScriptError(error)
+    return value
+
+def make_function(node, context):
+    func_name = node.variable_name_tok.value if node.variable_name_tok else None
+    arg_names = [arg_name.value for arg_name in node.arg_name_toks]
+    memo = Memo(node.memo_size) if node.memo_size is not None else None
+    func_value = Function(func_name, node.body_node, arg_names, node.scope, memo).set_context(context).set_pos(node.pos_start, node.pos_end)
+
+    if node.variable_name_tok:
+        context.symbol_table.assign(func_name, node.slot, func_value)
+    return func_value
+
+def execute(value, args):
+    res = value.execute(args)
+    if res.error: raise ScriptError(res.error)
+    return res.value
+
+def call(function, args, caller):
+    if function.memo:
+        key = memo_key(args)
+        if key is not None:
+            found, value = function.memo.get(key)
+            if found: return value
+
+            value = call_body(function, args, caller)
+            function.memo.store(key, value)
+            return value
+
+    return call_body(function, args, caller)
+
+# same trampoline as Function.execute_body
+def call_body(function, args, caller):
+    meter = function.context.symbol_table.root.meter
+    error = meter.enter(function, caller)
+    if error: raise ScriptError(error)
+
+    try:
+        while True:
+            new_context, error = function.enter(args)
+            if error: raise ScriptError(error)
+
+            value = unit_for(function.body_node, True, function.name)(new_context)
+            if type(value) is not TailCall: return value
+            function, args = value.function, value.args
+    finally:
+        meter.leave()
+
+# a loop iteration went past the countdown of the run's Meter
+def check_limits(meter, node, context):
+    error = meter.check(node, context)
+    if error: raise ScriptError(error)
+
+# a List literal or a collected loop value went over the memory limit
+def allocate(meter, size, node, context):
+    error = meter.allocate_at(size, node, context)
+    if error: raise ScriptError(error)
+
+RUNTIME = {
+    'Num': Num,
+    'List': List,
+    'Function': Function,
+    'TailCall': TailCall,
+    'LoopElements': LoopElements,
+    'make_num': make_num,
+    'callee': callee,
+    'undefined': undefined,
+    'division_by_zero': division_by_zero,
+    'binary': binary,
+    'unary': unary,
+    'make_function': make_function,
+    'execute': execute,
+    'call': call,
+    'check_limits': check_limits,
+    'allocate': allocate,
+}
+
+
+# code cache
+# compiled units keyed by the node they were made from, which is kept with
+# them so its id stays valid. Trees from the program cache are the same
+# objects on every run, so a program is only transpiled once
+class CodeCache:
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.units = OrderedDict()
+        # sessions may share the cache across threads
+        self.lock = threading.Lock()
+
+    def get(self, node):
+        with self.lock:
+            entry = self.units.get(id(node))
+            if entry is None: return None
+            self.units.move_to_end(id(node))
+            return entry[1]
+
+    def store(self, node, unit):
+        with self.lock:
+            self.units[id(node)] = (node, unit)
+            if len(self.units) > self.size:
+                self.units.popitem(last=False)
+
+code_cache = CodeCache()
+
+# Python function running node. A tree too deep for Python's parser or
+# compiler runs on the closure engine instead, its closures take the same calls
+def unit_for(node, function, name='<program>'):
+    unit = code_cache.get(node)
+    if unit is None:
+        try:
+            unit = compile_unit(node, function, name)
+        except (RecursionError, SyntaxError, MemoryError):
+            unit = ClosureCompiler().compile(node)
+        code_cache.store(node, unit)
+    return unit
+
+def compile_unit(node, function, name):
+    def_name = 'body' if function else 'program'
+    transpiler = Transpiler(function)
+    source, line_nodes = transpiler.transpile(node, def_name)
+
+    namespace = dict(RUNTIME, **transpiler.namespace)
+    namespace['__source__'] = source
+    namespace['__line_nodes__'] = line_nodes
+    exec(compile(source, f'<python {node.pos_start.fn} {name}>', 'exec'), namespace)
+    return namespace[def_name]
+
+# script position of the innermost generated line a Python exception passed
+# through, added to it as a note
+def locate(exception):
+    node = None
+    traceback = exception.__traceback__
+    while traceback:
+        line_nodes = traceback.tb_frame.f_globals.get('__line_nodes__')
+        if line_nodes and line_nodes[traceback.tb_lineno - 1]:
+            node = line_nodes[traceback.tb_lineno - 1]
+        traceback = traceback.tb_next
+
+    if node:
+        pos = node.pos_start
+        exception.add_note(f'File {pos.fn}, line {pos.ln + 1}\n\n' + string_arrows(pos.ftxt, node.pos_start, node.pos_end))
+
+def run(node, context):
+    res = RunTimeResult()
+    try:
+        value = unit_for(node, False)(context)
+    except ScriptError as error:
+        return res.failure(error.error)
+    except Exception as exception:
+        locate(exception)
+        raise
+    return res.success(value)
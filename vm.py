@@ -0,0 +1,456 @@
+# Imports
+from basic import *
+
+
+# opcodes
+# instructions are stored as parallel opcode / argument / node arrays in Code
+OP_NUM, OP_STRING, OP_LIST, OP_LOAD, OP_STORE = 0, 1, 2, 3, 4
+OP_BINARY, OP_UNARY, OP_JUMP, OP_JUMP_IF_FALSE, OP_NONE = 5, 6, 7, 8, 9
+OP_FOR_PREP, OP_FOR_ITER, OP_LOOP_NEW, OP_LOOP_APPEND, OP_LOOP_END = 10, 11, 12, 13, 14
+OP_FUNCTION, OP_CALLEE, OP_CALL, OP_SHORT_CIRCUIT, OP_TAIL_CALL = 15, 16, 17, 18, 19
+
+OPNAMES = [
+    'NUM', 'STRING', 'LIST', 'LOAD', 'STORE',
+    'BINARY', 'UNARY', 'JUMP', 'JUMP_IF_FALSE', 'NONE',
+    'FOR_PREP', 'FOR_ITER', 'LOOP_NEW', 'LOOP_APPEND', 'LOOP_END',
+    'FUNCTION', 'CALLEE', 'CALL', 'SHORT_CIRCUIT', 'TAIL_CALL'
+]
+
+# code objects
+class Code:
+    def __init__(self, name):
+        self.name = name
+        self.ops = []
+        self.args = []
+        self.consts = []
+        # node of every instruction, used for positions in values and errors
+        self.nodes = []
+
+    def emit(self, op, arg, node):
+        self.ops.append(op)
+        self.args.append(arg)
+        self.nodes.append(node)
+        return len(self.ops) - 1
+
+    def patch(self, at, target):
+        self.args[at] = target
+
+    def const(self, value):
+        self.consts.append(value)
+        return len(self.consts) - 1
+
+    def here(self):
+        return len(self.ops)
+
+    def disassemble(self):
+        lines = []
+        for pc in range(len(self.ops)):
+            op, arg = self.ops[pc], self.args[pc]
+            lines.append(f'{pc:>5} {OPNAMES[op]:<14} {arg}')
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return f'<code {self.name}>'
+
+
+# compiler
+# lowers the tree produced by Parser.parse() into a Code object
+class Compiler:
+    def compile(self, node, name='<program>'):
+        code = Code(name)
+        self.visit(node, code)
+        return code
+
+    def visit(self, node, code):
+        method_name = f'visit_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_visit_method)
+        return method(node, code)
+
+    def no_visit_method(self, node, code):
+        raise Exception(f'No visit_{type(node).__name__} method defined')
+
+    def visit_NumNode(self, node, code):
+        code.emit(OP_NUM, code.const(make_num(node.tok.value)), node)
+
+    def visit_StringNode(self, node, code):
+        code.emit(OP_STRING, code.const(String(node.tok.value)), node)
+
+    def visit_ListNode(self, node, code):
+        for element_node in node.element_nodes:
+            self.visit(element_node, code)
+        code.emit(OP_LIST, len(node.element_nodes), node)
+
+    def visit_VariableAccessNode(self, node, code):
+        code.emit(OP_LOAD, code.const((node.variable_name_tok.value, node.depth, node.slot)), node)
+
+    def visit_VariableAssignNode(self, node, code):
+        self.visit(node.value_node, code)
+        code.emit(OP_STORE, code.const((node.variable_name_tok.value, node.slot)), node)
+
+    def visit_BinaryOpNode(self, node, code):
+        self.visit(node.left_node, code)
+        if node.short_circuit is not None:
+            skip = code.emit(OP_SHORT_CIRCUIT, None, node)
+            self.visit(node.right_node, code)
+            code.emit(OP_BINARY, 0, node)
+            code.patch(skip, code.here())
+            return
+
+        self.visit(node.right_node, code)
+        code.emit(OP_BINARY, 0, node)
+
+    def visit_UnaryOpNode(self, node, code):
+        self.visit(node.node, code)
+        # unary plus leaves the operand on the stack as it is
+        if node.method_name is not None:
+            code.emit(OP_UNARY, 0, node)
+
+    def visit_IfNode(self, node, code):
+        exit_jumps = []
+
+        for condition, expr in node.cases:
+            self.visit(condition, code)
+            skip = code.emit(OP_JUMP_IF_FALSE, None, condition)
+            self.visit(expr, code)
+            exit_jumps.append(code.emit(OP_JUMP, None, node))
+            code.patch(skip, code.here())
+
+        if node.else_case:
+            self.visit(node.else_case, code)
+        else:
+            code.emit(OP_NONE, None, node)
+
+        for jump in exit_jumps:
+            code.patch(jump, code.here())
+
+    def visit_ForNode(self, node, code):
+        self.visit(node.start_value_node, code)
+        self.visit(node.end_value_node, code)
+        if node.step_value_node:
+            self.visit(node.step_value_node, code)
+
+        variable_name = node.variable_name_tok.value
+        code.emit(OP_FOR_PREP, code.const((variable_name, node.slot, node.step_value_node is not None)), node)
+        loop_start = code.emit(OP_FOR_ITER, None, node)
+        self.visit(node.body_node, code)
+        code.emit(OP_LOOP_APPEND, None, node)
+        code.emit(OP_JUMP, loop_start, node)
+        code.patch(loop_start, code.here())
+        code.emit(OP_LOOP_END, None, node)
+
+    def visit_WhileNode(self, node, code):
+        code.emit(OP_LOOP_NEW, None, node)
+        loop_start = code.here()
+        self.visit(node.condition_node, code)
+        exit_jump = code.emit(OP_JUMP_IF_FALSE, None, node)
+        self.visit(node.body_node, code)
+        code.emit(OP_LOOP_APPEND, None, node)
+        code.emit(OP_JUMP, loop_start, node)
+        code.patch(exit_jump, code.here())
+        code.emit(OP_LOOP_END, None, node)
+
+    def visit_FuncDefNode(self, node, code):
+        code.emit(OP_FUNCTION, code.const(node), node)
+
+    def visit_CallNode(self, node, code):
+        self.visit(node.node_to_call, code)
+        code.emit(OP_CALLEE, None, node)
+        for arg_node in node.arg_nodes:
+            self.visit(arg_node, code)
+        code.emit(OP_TAIL_CALL if node.tail else OP_CALL, len(node.arg_nodes), node)
+
+
+# loop bookkeeping kept on the value stack while a FOR/WHILE runs
+class LoopState:
+    def __init__(self, node, variable_name=None, slot=None, i=None, end_value=None, step=None):
+        self.variable_name = variable_name
+        self.slot = slot
+        self.start = i
+        self.i = i
+        self.end_value = end_value
+        self.step = step
+        self.ascending = step is None or step >= 0
+        # same rules as Interpreter.visit_ForNode / visit_WhileNode
+        self.lazy = getattr(node, 'lazy', False) and type(i) is int and type(step) is int
+        self.collect = not (node.discard or self.lazy)
+        self.count = 0
+        self.elements = []
+
+
+# vm
+# calls do not recurse in Python: the caller's code, pc, stack and context
+# are pushed on VM.frames and the callee runs in the same loop, so script
+# recursion is bounded by max_depth instead of the CPython stack, or by the
+# depth of the run's Limits when it has one
+MAX_DEPTH = 10000
+
+class VM:
+    def __init__(self, max_depth=MAX_DEPTH):
+        self.max_depth = max_depth
+        # compiled function bodies, keyed by the body node of the Function
+        self.codes = {}
+
+    def code_for(self, function):
+        entry = self.codes.get(id(function.body_node))
+        if entry is None:
+            entry = (function.body_node, Compiler().compile(function.body_node, function.name))
+            self.codes[id(function.body_node)] = entry
+        return entry[1]
+
+    def run(self, code, context):
+        steps = self.steps(code, context)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as stop:
+                return stop.value
+
+    # runs code as a generator that yields after every interval loop
+    # iterations, calls and returns, and returns the RunTimeResult when done.
+    # Without an interval the countdown starts below zero and never reaches
+    # it again, so the generator only returns
+    def steps(self, code, context, interval=None):
+        res = RunTimeResult()
+        frames = []
+        stack = []
+        pc = 0
+        countdown = interval or 0
+        meter = context.symbol_table.root.meter
+        max_depth = self.max_depth if meter.max_depth is None else meter.max_depth
+
+        while True:
+            countdown -= 1
+            if not countdown:
+                yield
+                countdown = interval
+
+            ops = code.ops
+            args = code.args
+            consts = code.consts
+            nodes = code.nodes
+            symbol_table = context.symbol_table
+            push = stack.append
+            pop = stack.pop
+            end = len(ops)
+
+            while pc < end:
+                op = ops[pc]
+                arg = args[pc]
+                pc += 1
+
+                if op == OP_LOAD:
+                    name, depth, slot = consts[arg]
+                    if depth == 0 and slot is not None:
+                        value = symbol_table.slots[slot]
+                        if value == None: value = symbol_table.get(name)
+                    else:
+                        value = symbol_table.lookup(name, depth, slot)
+                    if not value:
+                        node = nodes[pc - 1]
+                        return res.failure(RunTimeError(
+                            node.pos_start, node.pos_end,
+                            f"'{name}' is not defined",
+                            context
+                        ))
+                    push(value)
+
+                elif op == OP_NUM:
+                    push(consts[arg])
+
+                elif op == OP_BINARY:
+                    right = pop()
+                    left = pop()
+                    node = nodes[pc - 1]
+
+                    if type(left) is Num and type(right) is Num:
+                        if node.num_op:
+                            push(make_num(node.num_op(left.value, right.value)))
+                            continue
+                        if right.value != 0:
+                            push(make_num(left.value / right.value))
+                            continue
+                        return res.failure(RunTimeError(
+                            node.right_node.pos_start, node.right_node.pos_end,
+                            'Division by zero',
+                            context
+                        ))
+
+                    left = located(left, node.left_node, context)
+                    right = located(right, node.right_node, context)
+                    result, error = getattr(left, node.method_name)(right)
+                    if error: return res.failure(error)
+                    push(result)
+
+                elif op == OP_JUMP_IF_FALSE:
+                    if not pop().is_true():
+                        pc = arg
+
+                elif op == OP_JUMP:
+                    pc = arg
+
+                elif op == OP_SHORT_CIRCUIT:
+                    left = stack[-1]
+                    if type(left) is Num and (left.value != 0) == nodes[pc - 1].short_circuit:
+                        stack[-1] = make_num(int(left.value))
+                        pc = arg
+
+                elif op == OP_FOR_ITER:
+                    state = stack[-1]
+                    if state.ascending:
+                        running = state.i < state.end_value.value
+                    else:
+                        running = state.i > state.end_value.value
+
+                    if running:
+                        symbol_table.assign(state.variable_name, state.slot, make_num(state.i))
+                        state.i += state.step
+                    else:
+                        pc = arg
+
+                elif op == OP_LOOP_APPEND:
+                    value = pop()
+                    state = stack[-1]
+                    if state.collect:
+                        state.elements.append(value)
+                        error = meter.allocate_at(REFERENCE_SIZE, nodes[pc - 1], context)
+                        if error: return res.failure(error)
+                    state.count += 1
+
+                    meter.countdown -= 1
+                    if not meter.countdown:
+                        error = meter.check(nodes[pc - 1], context)
+                        if error: return res.failure(error)
+
+                    countdown -= 1
+                    if not countdown:
+                        yield
+                        countdown = interval
+
+                elif op == OP_STORE:
+                    name, slot = consts[arg]
+                    symbol_table.assign(name, slot, stack[-1])
+
+                elif op == OP_CALLEE:
+                    push(callee(pop(), nodes[pc - 1], context))
+
+                elif op == OP_CALL or op == OP_TAIL_CALL:
+                    call_args = stack[len(stack) - arg:]
+                    del stack[len(stack) - arg:]
+                    value_to_call = pop()
+
+                    if type(value_to_call) is Function:
+                        # result of a FUN MEMO call, stored when the callee returns
+                        pending = None
+                        if value_to_call.memo:
+                            key = memo_key(call_args)
+                            if key is not None:
+                                found, value = value_to_call.memo.get(key)
+                                if found:
+                                    push(value)
+                                    continue
+                                pending = (value_to_call.memo, key)
+
+                        if op == OP_TAIL_CALL and not pending:
+                            # the callee's value is this code's value, so it
+                            # takes over the current frame instead of a new one
+                            new_context, error = value_to_call.enter(call_args)
+                            if error: return res.failure(error)
+
+                            code = self.code_for(value_to_call)
+                            context = new_context
+                            stack = []
+                            pc = 0
+                            break
+
+                        if len(frames) >= max_depth:
+                            node = nodes[pc - 1]
+                            return res.failure(RunTimeError(
+                                node.pos_start, node.pos_end,
+                                'Maximum recursion depth exceeded',
+                                context
+                            ))
+
+                        new_context, error = value_to_call.enter(call_args)
+                        if error: return res.failure(error)
+
+                        # suspend the caller and start the callee, the
+                        # outer loop picks up its code
+                        frames.append((code, pc, stack, context, pending))
+                        code = self.code_for(value_to_call)
+                        context = new_context
+                        stack = []
+                        pc = 0
+                        break
+
+                    call_res = value_to_call.execute(call_args)
+                    if call_res.error: return res.failure(call_res.error)
+                    push(call_res.value)
+
+                elif op == OP_UNARY:
+                    num = pop()
+                    node = nodes[pc - 1]
+
+                    if type(num) is Num:
+                        push(make_num(node.num_op(num.value)))
+                        continue
+
+                    operand_args = () if node.operand is None else (located(Num(node.operand), node, context),)
+                    num, error = getattr(located(num, node.node, context), node.method_name)(*operand_args)
+                    if error: return res.failure(error)
+                    push(num)
+
+                elif op == OP_STRING:
+                    push(consts[arg])
+
+                elif op == OP_LIST:
+                    elements = stack[len(stack) - arg:]
+                    del stack[len(stack) - arg:]
+                    node = nodes[pc - 1]
+                    error = meter.allocate_at(REFERENCE_SIZE * arg, node, context)
+                    if error: return res.failure(error)
+                    push(List(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
+
+                elif op == OP_NONE:
+                    push(None)
+
+                elif op == OP_FOR_PREP:
+                    variable_name, slot, has_step = consts[arg]
+                    step_value = pop() if has_step else Num(1)
+                    end_value = pop()
+                    start_value = pop()
+                    push(LoopState(nodes[pc - 1], variable_name, slot, start_value.value, end_value, step_value.value))
+
+                elif op == OP_LOOP_NEW:
+                    push(LoopState(nodes[pc - 1]))
+
+                elif op == OP_LOOP_END:
+                    node = nodes[pc - 1]
+                    state = pop()
+                    if state.lazy:
+                        elements = LoopElements(node, context, state.start, state.step, state.count)
+                    else:
+                        elements = state.elements
+                    push(List(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
+
+                elif op == OP_FUNCTION:
+                    node = consts[arg]
+                    func_name = node.variable_name_tok.value if node.variable_name_tok else None
+                    arg_names = [arg_name.value for arg_name in node.arg_name_toks]
+                    memo = Memo(node.memo_size) if node.memo_size is not None else None
+                    func_value = Function(func_name, node.body_node, arg_names, node.scope, memo).set_context(context).set_pos(node.pos_start, node.pos_end)
+
+                    if node.variable_name_tok:
+                        symbol_table.assign(func_name, node.slot, func_value)
+
+                    push(func_value)
+
+                else:
+                    raise Exception(f'Unknown opcode {op}')
+
+            else:
+                # the code ran to its end, return its value to the caller
+                value = stack[-1]
+                if not frames: return res.success(value)
+                code, pc, stack, context, pending = frames.pop()
+                if pending: pending[0].store(pending[1], value)
+                stack.append(value)